@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+import sales_data
+
+# Intervals shown on approximate charts, in standard errors either side (95%)
+Z = 1.96
+
+HLL_REGISTERS = 1 << sales_data.HLL_PRECISION
+HLL_RANK_BITS = 64 - sales_data.HLL_PRECISION
+HLL_RELATIVE_ERROR = 1.04 / np.sqrt(HLL_REGISTERS)
+
+
+def _sigma(x):
+    # x + sum over k >= 1 of x ** (2 ** k) * 2 ** (k - 1)
+    if x == 1:
+        return np.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    # (1 - x - sum over k >= 1 of (1 - x ** (2 ** -k)) ** 2 * 2 ** -k) / 3
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = np.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def hll_estimate(histogram):
+    """Distinct count of a merged HyperLogLog sketch from its register histogram
+    (histogram[k] registers hold rank k, for k = 0 .. HLL_RANK_BITS + 1).
+
+    Ertl's improved estimator: unlike the classic one it needs neither a switch to linear
+    counting for small counts nor bias correction in between.
+    """
+    m = HLL_REGISTERS
+    z = m * _tau(1 - histogram[HLL_RANK_BITS + 1] / m)
+    for k in range(HLL_RANK_BITS, 0, -1):
+        z = 0.5 * (z + histogram[k])
+    z += m * _sigma(histogram[0] / m)
+    return m * m / (2 * np.log(2)) / z
+
+
+def distinct_counts(registers, by):
+    # Estimated distinct counts per `by` group, with their 95% interval half-widths, from rows
+    # of (group, rank, registers): how many of the group's merged registers hold each rank
+    rows = []
+    for key, group in registers.groupby(by, observed=True, sort=False):
+        histogram = np.zeros(HLL_RANK_BITS + 2)
+        histogram[group['rank'].to_numpy()] = group['registers'].to_numpy()
+        # Registers no account hashed to are never stored
+        histogram[0] = HLL_REGISTERS - histogram[1:].sum()
+        estimate = hll_estimate(histogram)
+        rows.append((*key, estimate, Z * HLL_RELATIVE_ERROR * estimate))
+    return pd.DataFrame(rows, columns=[*by, 'estimate', 'error'])
+
+
+def sample_total(sampled, inclusion):
+    # Horvitz-Thompson total from the rows of a uniform sample that each row entered with
+    # probability `inclusion`, with its 95% interval half-width
+    sampled = np.asarray(sampled, dtype=float)
+    return sampled / inclusion, Z * np.sqrt(sampled * (1 - inclusion)) / inclusion
+
+
+def estimated(frame):
+    # Mark a frame as holding estimates, so its figure says so
+    frame.attrs['approximate'] = True
+    return frame
+
+
+def note(frame):
+    # Title suffix for a chart of estimates, empty for exact results
+    return " (approximate, 95% intervals)" if frame.attrs.get('approximate') else ''
+
+
+def error_bars(frame, column):
+    # error_y for a trace of `column`, or None when the frame holds exact values
+    if f'{column}_error' not in frame.columns:
+        return None
+    return dict(type='data', array=frame[f'{column}_error'], visible=True, thickness=1.5)
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import time
+
+import duckdb
+import pandas as pd
+
+import panels
+import perf_log
+import sales_data
+import synth_data
+from query_cache import QueryCache
+
+DEFAULT_SCALES = [1, 100, 10000]
+DEFAULT_WORK_DIR = os.path.join(sales_data.DATA_DIR, 'benchmark')
+
+
+def prepare(scale, work_dir, seed=0):
+    # Generate the scaled CSVs and build their database, reusing both from earlier runs
+    data_dir = os.path.join(work_dir, f'x{scale}')
+    if not os.path.exists(sales_data.csv_path('web_events', data_dir)):
+        synth_data.generate(scale, data_dir, seed=seed)
+    db_path = os.path.join(data_dir, 'sales.duckdb')
+    start = time.perf_counter()
+    built = sales_data.ensure_database(db_path, data_dir)
+    return db_path, time.perf_counter() - start if built else None
+
+
+def benchmark_scale(db_path, regions, repeat, workers=None, **context):
+    # Time every panel `repeat` times per region, each time with an empty result cache
+    con = duckdb.connect(db_path, read_only=True)
+    runner = panels.QueryRunner(con, sales_data.read_data_version(con), QueryCache(), workers)
+    records = []
+    try:
+        for region in regions:
+            for run in range(repeat):
+                runner.cache.invalidate()
+                timings = {}
+                start = time.perf_counter()
+                figures = panels.compute_panels(runner, list(panels.PANELS), region, timings=timings)
+                wall_seconds = time.perf_counter() - start
+
+                # No Streamlit here: JSON serialization stands in for st.plotly_chart
+                for name, figure in figures.items():
+                    start = time.perf_counter()
+                    timings[name]['payload_bytes'] = len(figure.to_json())
+                    timings[name]['chart_seconds'] = time.perf_counter() - start
+
+                records += perf_log.make_records(
+                    timings, region=region, run=run, wall_seconds=wall_seconds, **context
+                )
+    finally:
+        runner.close()
+    return records
+
+
+def summarize(records):
+    # Median milliseconds per scale, region and panel across the repeated runs
+    frame = pd.DataFrame(records)
+    columns = perf_log.PHASES + ['total_seconds']
+    summary = frame.groupby(['scale', 'region', 'panel'], sort=False).agg(
+        {**{column: 'median' for column in columns}, 'result_rows': 'max', 'rows': 'max', 'payload_bytes': 'max'}
+    )
+    summary[columns] = (summary[columns] * 1000).round(2)
+    return summary.rename(columns={column: column.replace('_seconds', '_ms') for column in columns}).reset_index()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every dashboard panel on synthetic data at several scales.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="Scale factors to run")
+    parser.add_argument('--region', action='append', help="Region to select (repeatable, default: All Regions)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per region; the report keeps the median")
+    parser.add_argument('--workers', type=int, help="Query worker threads (default: SALES_QUERY_WORKERS)")
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR, help="Where generated data, databases and reports go")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the generator")
+    args = parser.parse_args()
+    regions = args.region or ['All Regions']
+
+    records = []
+    for scale in args.scales:
+        db_path, build_seconds = prepare(scale, args.work_dir, args.seed)
+        if build_seconds is not None:
+            print(f"{scale}x: built {db_path} in {build_seconds:.1f}s")
+        records += benchmark_scale(db_path, regions, args.repeat, args.workers, scale=scale)
+
+    runs_path = os.path.join(args.work_dir, 'benchmark_runs.jsonl')
+    with open(runs_path, 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+    summary = summarize(records)
+    summary_path = os.path.join(args.work_dir, 'benchmark_summary.csv')
+    summary.to_csv(summary_path, index=False)
+
+    # Panels down, scales across: median total milliseconds
+    print(summary.pivot_table(index=['region', 'panel'], columns='scale', values='total_ms', sort=False).to_string())
+    print(f"Wrote {runs_path} and {summary_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+import pyarrow as pa
+import tornado.web
+from tornado.ioloop import IOLoop
+
+import panels
+import sales_data
+from query_cache import DiskResultCache, QueryCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+CONTENT_TYPES = {'json': 'application/json', 'arrow': ARROW_STREAM}
+
+
+# Controls holding a selection of any size, rather than a fixed number of values
+SELECTION_CONTROLS = {'compare_years'}
+
+
+def _control_value(name, text, default):
+    # "10,50" for range controls, "2013,2017" for selections, "1000" for single values
+    try:
+        values = tuple(int(part) for part in text.split(',') if part.strip())
+    except ValueError:
+        raise ValueError(f"{name} takes comma-separated integers") from None
+    if name in SELECTION_CONTROLS:
+        return tuple(sorted(values))
+    expected = len(default) if isinstance(default, tuple) else 1
+    if len(values) != expected:
+        raise ValueError(f"{name} takes {expected} comma-separated integer{'s' if expected > 1 else ''}")
+    if isinstance(default, bool):
+        return bool(values[0])
+    return values if isinstance(default, tuple) else values[0]
+
+
+def serialize(frame, fmt):
+    # Panel datasets as JSON records or an Arrow IPC stream; an index that carries data
+    # (plot3's pivot) becomes a column
+    frame = frame.reset_index(drop=frame.index.name is None)
+    frame.columns = [str(column) for column in frame.columns]
+    if fmt == 'json':
+        return frame.to_json(orient='records', date_format='iso').encode()
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class DataApi:
+    """Serves each panel's dataset over HTTP, through a QueryRunner and its result cache.
+
+    `database` is a panels.OpenDatabase: inside the dashboard its own, standalone one the API
+    opens itself. Either way a rebuilt or appended-to file is served from the next request
+    on, while requests already running finish on the previous one.
+    """
+
+    def __init__(self, database, max_payloads=1024):
+        self.database = database
+        self.max_payloads = max_payloads
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current_runner(self):
+        return self.database.runner()
+
+    def regions(self, runner):
+        return ['All Regions'] + runner.run("SELECT name FROM region ORDER BY id;")['name'].tolist()
+
+    def parse_controls(self, name, arguments):
+        # Only the panel's own controls can be set; anything else is ignored
+        return {
+            control: _control_value(control, arguments[control], panels.DEFAULT_CONTROLS[control])
+            for control in panels.PANELS[name].controls if control in arguments
+        }
+
+    @staticmethod
+    def _payload_key(runner, name, region, controls, fmt):
+        return name, region, tuple(sorted(controls.items())), fmt, runner.data_version
+
+    def cached_payload(self, runner, name, region, controls, fmt):
+        key = self._payload_key(runner, name, region, controls, fmt)
+        with self._lock:
+            body = self._payloads.get(key)
+            if body is not None:
+                self._payloads.move_to_end(key)
+        return body
+
+    def payload(self, runner, name, region, controls, fmt):
+        # Serialized dataset, kept per data version so repeated requests skip queries and encoding
+        body = self.cached_payload(runner, name, region, controls, fmt)
+        if body is not None:
+            return body
+
+        key = self._payload_key(runner, name, region, controls, fmt)
+        panel = panels.PANELS[name]
+        merged = {**panels.DEFAULT_CONTROLS, **controls}
+        queries = panel.queries(region, merged)
+        results = runner.run_many(queries)
+        body = serialize(panel.data(results, region, merged), fmt)
+
+        with self._lock:
+            # Entries of older data versions are never asked for again
+            for stale in [k for k in self._payloads if k[-1] != runner.data_version]:
+                del self._payloads[stale]
+            self._payloads[key] = body
+            while len(self._payloads) > self.max_payloads:
+                self._payloads.popitem(last=False)
+        return body
+
+    def make_app(self):
+        return tornado.web.Application([
+            (r'/panels', PanelListHandler, {'api': self}),
+            (r'/panels/([a-z0-9]+)', PanelDataHandler, {'api': self}),
+        ])
+
+    async def serve(self, port=DEFAULT_PORT, address='127.0.0.1'):
+        self.make_app().listen(port, address)
+        await asyncio.Event().wait()
+
+    def start(self, port=DEFAULT_PORT, address='127.0.0.1'):
+        # Serve from a daemon thread with its own event loop, e.g. next to the Streamlit server
+        def run():
+            try:
+                asyncio.run(self.serve(port, address))
+            except OSError as error:
+                logger.warning("Could not start the data API on %s:%s: %s", address, port, error)
+
+        thread = threading.Thread(target=run, name='data-api', daemon=True)
+        thread.start()
+        return thread
+
+
+class _ApiHandler(tornado.web.RequestHandler):
+    def initialize(self, api):
+        self.api = api
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({'error': self._reason})
+
+
+class PanelListHandler(_ApiHandler):
+    async def get(self):
+        runner = self.api.current_runner()
+        regions = await IOLoop.current().run_in_executor(None, self.api.regions, runner)
+        sections = {name: section for section, names in panels.SECTIONS.items() for name in names}
+        self.finish({
+            'data_version': runner.data_version,
+            'regions': regions,
+            'panels': {
+                name: {'section': sections.get(name), 'controls': {
+                    control: panels.DEFAULT_CONTROLS[control] for control in panel.controls
+                }}
+                for name, panel in panels.PANELS.items()
+            },
+        })
+
+
+class PanelDataHandler(_ApiHandler):
+    async def get(self, name):
+        if name not in panels.PANELS:
+            raise tornado.web.HTTPError(404, reason=f"Unknown panel {name}")
+        fmt = self.get_argument('format', None)
+        if fmt is None:
+            fmt = 'arrow' if ARROW_STREAM in self.request.headers.get('Accept', '') else 'json'
+        if fmt not in CONTENT_TYPES:
+            raise tornado.web.HTTPError(400, reason=f"Unknown format {fmt}")
+
+        runner = self.api.current_runner()
+        region = self.get_argument('region', 'All Regions')
+        arguments = {key: self.get_argument(key) for key in self.request.arguments}
+        try:
+            controls = self.api.parse_controls(name, arguments)
+        except ValueError as error:
+            raise tornado.web.HTTPError(400, reason=str(error))
+
+        body = self.api.cached_payload(runner, name, region, controls, fmt)
+        if body is None:
+            # Unknown regions would only yield empty datasets, so they are rejected up front
+            regions = await IOLoop.current().run_in_executor(None, self.api.regions, runner)
+            if region not in regions:
+                raise tornado.web.HTTPError(404, reason=f"Unknown region {region}")
+
+        # Datasets only change with the data or with the schema (rebuilt from the same data, which
+        # keeps its data version), so both make up the validator. It is only checked once the
+        # request is known to be valid
+        etag = f'"{runner.data_version}-{sales_data.SCHEMA_VERSION}-{fmt}"'
+        self.set_header('ETag', etag)
+        self.set_header('Vary', 'Accept')
+        self.set_header('X-Data-Version', runner.data_version)
+        if etag in self.request.headers.get('If-None-Match', ''):
+            self.set_status(304)
+            return self.finish()
+
+        if body is None:
+            body = await IOLoop.current().run_in_executor(
+                None, self.api.payload, runner, name, region, controls, fmt)
+        self.set_header('Content-Type', CONTENT_TYPES[fmt])
+        self.finish(body)
+
+    def compute_etag(self):
+        # The version ETag set above replaces tornado's body hash
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the dashboard panels' datasets as JSON and Arrow over HTTP.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument('--address', default='127.0.0.1', help="Address to bind (default: localhost only)")
+    parser.add_argument('--db', default=sales_data.DB_PATH, help="Path of the DuckDB database file")
+    args = parser.parse_args()
+
+    sales_data.ensure_database(args.db)
+    disk = DiskResultCache(sales_data.RESULT_CACHE_DIR) if sales_data.RESULT_CACHE_DIR else None
+    api = DataApi(panels.OpenDatabase(args.db, QueryCache(disk=disk)))
+    print(f"Serving panel datasets on http://{args.address}:{args.port}/panels")
+    asyncio.run(api.serve(args.port, args.address))
+
+
+if __name__ == '__main__':
+    main()
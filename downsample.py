@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+# Most points (bars, markers, line vertices) one chart sends to the browser; larger results
+# are reduced before the figure is built. SALES_POINT_BUDGET_<CHART> (e.g. _PLOT7) overrides
+# the default for one chart
+POINT_BUDGET = int(os.environ.get('SALES_POINT_BUDGET', 2000))
+
+# Scatter traces with more points than this are drawn with WebGL instead of SVG
+WEBGL_POINTS = int(os.environ.get('SALES_WEBGL_POINTS', 1000))
+
+
+def point_budget(chart):
+    return int(os.environ.get(f'SALES_POINT_BUDGET_{chart.upper()}', POINT_BUDGET))
+
+
+def scatter_type(points):
+    # go.Scatter, or go.Scattergl for a trace too large to draw as SVG
+    return go.Scattergl if points > WEBGL_POINTS else go.Scatter
+
+
+def reduced(frame, rows, unit):
+    # Record how many rows `frame` stands for, so the figure can say what it shows
+    frame.attrs['reduced_from'] = (rows, unit)
+    return frame
+
+
+def reduced_note(frame):
+    # Title suffix for a reduced chart, empty when everything is shown
+    if 'reduced_from' not in frame.attrs:
+        return ''
+    rows, unit = frame.attrs['reduced_from']
+    return f" ({rows:,} {unit}, reduced)"
+
+
+def top_n(frame, category, n, rank_by, means=(), weight=None, other='Other', unit='rows'):
+    """Keep the `n` - 1 categories ranked highest by `rank_by` (a column or per-row scores)
+    and fold the rest into one row.
+
+    Folded columns are summed, except `means`, which are averaged weighted by `weight`
+    (so averages stay averages over the underlying rows).
+    """
+    if len(frame) <= n:
+        return frame
+    scores = frame[rank_by] if isinstance(rank_by, str) else rank_by
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    top = frame.iloc[order[:n - 1]]
+    rest = frame.iloc[order[n - 1:]]
+
+    folded = {category: f"{other} ({len(rest):,})"}
+    for column in frame.columns:
+        if column == category:
+            continue
+        if column in means:
+            present = rest[column].notna()
+            if present.any():
+                weights = rest.loc[present, weight] if weight is not None else None
+                folded[column] = np.average(rest.loc[present, column], weights=weights)
+            else:
+                folded[column] = np.nan
+        elif pd.api.types.is_numeric_dtype(frame[column]):
+            folded[column] = rest[column].sum()
+        else:
+            folded[column] = None
+    return reduced(pd.concat([top, pd.DataFrame([folded])], ignore_index=True), len(frame), unit)
+
+
+def histogram(values, max_bins):
+    # Bin a distribution server-side: one row per non-empty bin with its edges, centre and count
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    edges = np.histogram_bin_edges(values, bins='auto') if len(values) else np.array([0.0, 1.0])
+    if len(edges) - 1 > max_bins:
+        edges = np.histogram_bin_edges(values, bins=max_bins)
+    counts, edges = np.histogram(values, bins=edges)
+    bins = pd.DataFrame({
+        'bin_start': edges[:-1],
+        'bin_end': edges[1:],
+        'bin_center': (edges[:-1] + edges[1:]) / 2,
+        'count': counts,
+    })
+    return bins[bins['count'] > 0].reset_index(drop=True)
+
+
+def lttb(x, y, n):
+    """Indices of the `n` points Largest-Triangle-Three-Buckets keeps from a series sorted by x.
+
+    The first and last points are always kept; every bucket in between contributes the point
+    forming the largest triangle with the previously kept point and the next bucket's mean, so
+    peaks and troughs survive the reduction.
+    """
+    length = len(x)
+    if n >= length:
+        return np.arange(length)
+    if n < 3:
+        return np.array([0, length - 1][:max(n, 0)], dtype=np.intp)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # n - 2 buckets over the points between the first and the last
+    edges = np.linspace(1, length - 1, n - 1).astype(np.intp)
+    selected = np.empty(n, dtype=np.intp)
+    selected[0], selected[-1] = 0, length - 1
+    previous = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[edges[i + 1]:edges[i + 2]].mean()
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = selected[i + 1] = start + np.argmax(areas)
+    return selected
@@ -0,0 +1,365 @@
+import argparse
+import io
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+
+import sales_data
+
+logger = logging.getLogger(__name__)
+
+# Panels drawn from the streamed counters instead of the database
+LIVE_PANELS = ['plot3', 'plot11', 'plot15']
+
+WEB_EVENT_COLUMNS = [name for name, _ in sales_data.SCHEMA['web_events']]
+
+# Waiting lines are applied every BATCH_SECONDS, in micro-batches of up to BATCH_ROWS
+BATCH_SECONDS = float(os.environ.get('SALES_LIVE_BATCH_SECONDS', 1.0))
+BATCH_ROWS = 10_000
+
+# Streamed ids remembered to skip repeats; ids up to the highest stored one count as stored
+RECENT_IDS = 100_000
+# Streamed events kept, compactly, until the database holds them, so a rebase carries them over
+MAX_PENDING_EVENTS = 1_000_000
+
+
+class ChannelCounters:
+    """Web event counts per region, rep and channel, and distinct accounts per region and
+    channel: everything plots 3, 11 and 15 show.
+
+    Seeded once from the web event rollup, then only incremented by streamed events, so the
+    panels never rescan the event history. Events are counted once per id: ids up to the
+    highest stored one (appended ids only grow) and the RECENT_IDS last streamed are skipped.
+    """
+
+    def __init__(self, runner):
+        self.data_version = runner.data_version
+        accounts = runner.run("""
+            SELECT account_id, region_name, sales_rep_name, account_name IS NOT NULL AS named
+            FROM account_dim;
+        """)
+        self._accounts = {
+            account_id: (region, rep, named)
+            for account_id, region, rep, named in accounts.itertuples(index=False)
+        }
+        self._account_ids = pd.Index(accounts['account_id'])
+
+        events = runner.run("""
+            SELECT region_name, sales_rep_name, channel, CAST(SUM(event_count) AS BIGINT) AS events
+            FROM web_event_cube
+            GROUP BY region_name, sales_rep_name, channel;
+        """)
+        self._events = defaultdict(int)
+        for region, rep, channel, count in events.itertuples(index=False):
+            self._events[region, rep, str(channel)] = count
+
+        # (accounts, named accounts) per region and channel; an account belongs to one region,
+        # so per-channel counts over several regions are sums of these
+        self._seen = set()
+        self._account_counts = defaultdict(lambda: [0, 0])
+        pairs = runner.run("SELECT DISTINCT channel, account_id FROM web_event_cube;")
+        self._count_accounts(zip(pairs['channel'].astype(str), pairs['account_id']))
+
+        max_id = runner.run("SELECT MAX(id) AS max_id FROM web_events;")['max_id'].iloc[0]
+        self._max_stored_id = int(max_id) if pd.notna(max_id) else -1
+        self._recent_ids = set()
+        self._recent_order = deque()
+        # Counted events (id, account_id, channel) the database does not hold yet
+        self._pending = deque()
+        self._pending_events = 0
+
+        self.streamed = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.last_batch_at = None
+        self._lock = threading.Lock()
+
+    def _count_accounts(self, pairs):
+        for channel, account_id in pairs:
+            if (channel, account_id) in self._seen or account_id not in self._accounts:
+                continue
+            self._seen.add((channel, account_id))
+            region, _, named = self._accounts[account_id]
+            counts = self._account_counts[region, channel]
+            counts[0] += 1
+            counts[1] += bool(named)
+
+    def _count(self, events):
+        # Add events (id, account_id, channel) known to be new to the counters; lock held
+        if not len(events):
+            return
+        counts = events[['channel', 'account_id']].value_counts()
+        for (channel, account_id), count in counts.items():
+            region, rep, _ = self._accounts[account_id]
+            self._events[region, rep, channel] += count
+        self._count_accounts(counts.index)
+
+        for event_id in events['id'].tolist():
+            self._recent_ids.add(event_id)
+            self._recent_order.append(event_id)
+        while len(self._recent_order) > RECENT_IDS:
+            self._recent_ids.discard(self._recent_order.popleft())
+
+        self._pending.append(events)
+        self._pending_events += len(events)
+        while self._pending_events > MAX_PENDING_EVENTS and len(self._pending) > 1:
+            dropped = self._pending.popleft()
+            self._pending_events -= len(dropped)
+            logger.warning("%d streamed web events not yet appended will not survive a rebase; "
+                           "append the spool to keep them", len(dropped))
+
+    def apply(self, batch):
+        # Count a micro-batch of web event rows (the web_events.csv columns, as text) and return
+        # the rows counted. Rows with an invalid id or an unknown account, channel or timestamp
+        # are counted as rejected; rows whose id is stored, recently streamed or repeated in the
+        # batch as duplicates. Neither is counted. Only the batch is looked at, never the history
+        ids = pd.to_numeric(batch['id'], errors='coerce')
+        account_id = pd.to_numeric(batch['account_id'], errors='coerce')
+        valid = (
+            (ids % 1 == 0)
+            & account_id.isin(self._account_ids)
+            & batch['channel'].isin(sales_data.CHANNELS)
+            & pd.to_datetime(batch['occurred_at'], errors='coerce').notna()
+        )
+        ids = ids.where(valid, -1).astype('int64')
+        with self._lock:
+            recent = np.fromiter((event_id in self._recent_ids for event_id in ids.tolist()), bool, len(ids))
+            repeated = valid & ((ids <= self._max_stored_id) | recent | ids.where(valid).duplicated())
+            counted = valid & ~repeated
+            self._count(pd.DataFrame({
+                'id': ids[counted],
+                'account_id': account_id[counted].astype('int64'),
+                'channel': batch.loc[counted, 'channel'],
+            }))
+            self.streamed += int(counted.sum())
+            self.rejected += int((~valid).sum())
+            self.duplicates += int(repeated.sum())
+            self.batches += 1
+            self.last_batch_at = time.time()
+        return batch[counted]
+
+    def rebased(self, runner):
+        # Counters seeded from `runner`'s database, plus the streamed events it does not hold
+        # yet, so the live panels never lose events that were not appended
+        counters = ChannelCounters(runner)
+        with self._lock:
+            pending = pd.concat(self._pending, ignore_index=True) if self._pending else None
+            stats = self.streamed, self.rejected, self.duplicates, self.batches, self.last_batch_at
+        if pending is not None and len(pending):
+            # Pending ids are above the previous highest stored id, so only the new rows are read
+            low, high = int(pending['id'].min()), int(pending['id'].max())
+            stored = runner.with_cursor(lambda cursor: cursor.execute(
+                "SELECT id FROM web_events WHERE id BETWEEN ? AND ?;", [low, high]
+            ).fetchnumpy()['id'])
+            with counters._lock:
+                counters._count(pending[~pending['id'].isin(stored)])
+        counters.streamed, counters.rejected, counters.duplicates, counters.batches, counters.last_batch_at = stats
+        return counters
+
+    def _frames(self, region_choice):
+        with self._lock:
+            events = pd.DataFrame(
+                [(*key, count) for key, count in self._events.items()],
+                columns=['region_name', 'sales_rep_name', 'channel', 'events']
+            )
+            accounts = pd.DataFrame(
+                [(*key, *counts) for key, counts in self._account_counts.items()],
+                columns=['region_name', 'channel', 'accounts', 'named_accounts']
+            )
+        if region_choice != 'All Regions':
+            events = events[events['region_name'] == region_choice]
+            accounts = accounts[accounts['region_name'] == region_choice]
+        return events, accounts
+
+    def results(self, name, region_choice):
+        # The query results `name`'s data function expects, counted from the stream
+        events, accounts = self._frames(region_choice)
+        channel = pd.CategoricalDtype(sales_data.CHANNELS)
+        events['channel'] = events['channel'].astype(channel)
+        accounts['channel'] = accounts['channel'].astype(channel)
+
+        if name == 'plot3':
+            frame = (events.groupby(['sales_rep_name', 'channel'], observed=True, dropna=False)['events'].sum()
+                     .rename('number_of_occurrences').reset_index()
+                     .sort_values('number_of_occurrences', ascending=False, ignore_index=True))
+            return {'web_events': frame}
+
+        by = ['region_name', 'channel'] if name == 'plot11' else ['channel']
+        totals = events.groupby(by, observed=True, dropna=False)['events'].sum().rename('total_events')
+        distinct = accounts.groupby(by, observed=True, dropna=False)[['accounts', 'named_accounts']].sum()
+        frame = pd.concat([totals, distinct], axis=1).fillna(0).astype('int64').reset_index()
+        if name == 'plot11':
+            frame = frame.rename(columns={'accounts': 'unique_accounts_impacted'}).drop(columns='named_accounts')
+            frame = frame.sort_values(['region_name', 'total_events'], ascending=[True, False], ignore_index=True)
+            return {'web_events': frame}
+        frame = frame.rename(columns={'accounts': 'unique_accounts', 'named_accounts': 'total_customers'})
+        return {'channels': frame.sort_values('total_events', ascending=False, ignore_index=True)}
+
+    def status(self):
+        last = time.strftime('%H:%M:%S', time.localtime(self.last_batch_at)) if self.last_batch_at else 'none yet'
+        return (f"Live: {self.streamed:,} events streamed in {self.batches:,} batches "
+                f"({self.rejected:,} rejected, {self.duplicates:,} duplicates), last batch {last}")
+
+
+class _LineHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            self.server.put(line.decode('utf-8', errors='replace'))
+
+
+class _LineServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LiveFeed:
+    """Streams web events into ChannelCounters in micro-batches.
+
+    `source` is a CSV file to tail (rows in web_events.csv column order, appended by another
+    process) or tcp://host:port to listen on for such rows, one per line. Rows received on a
+    socket are also appended to `spool_path`, if given, so they can be loaded into the
+    database later with `sales_data.py --append-web-events`.
+    """
+
+    def __init__(self, source, counters, spool_path=None, from_start=False, batch_seconds=BATCH_SECONDS):
+        self.source = source
+        self.counters = counters
+        self.spool_path = spool_path
+        self.from_start = from_start
+        self.batch_seconds = batch_seconds
+        self._lines = queue.SimpleQueue()
+        self._stopped = threading.Event()
+        # Held while a batch is applied, so rebase() never swaps counters in the middle of one
+        self._lock = threading.Lock()
+        self._server = None
+
+    def rebase(self, runner):
+        # Counters for a rebuilt database, which holds whatever was appended from the stream;
+        # events streamed since are carried over
+        with self._lock:
+            if runner.data_version != self.counters.data_version:
+                self.counters = self.counters.rebased(runner)
+
+    def _tail(self, path):
+        position = None
+        while not self._stopped.is_set():
+            if not os.path.exists(path):
+                self._stopped.wait(self.batch_seconds)
+                continue
+            size = os.path.getsize(path)
+            if position is None:
+                position = 0 if self.from_start else size
+            elif size < position:
+                # Truncated or replaced: start over from its beginning
+                position = 0
+            if size > position:
+                with open(path, 'rb') as f:
+                    f.seek(position)
+                    data = f.read(size - position)
+                # Only complete lines; a partly written last line is read on the next pass
+                complete = data[:data.rfind(b'\n') + 1]
+                position += len(complete)
+                for line in complete.decode('utf-8', errors='replace').splitlines():
+                    self._lines.put(line)
+            self._stopped.wait(self.batch_seconds / 2)
+
+    def _drain(self):
+        lines = []
+        while len(lines) < BATCH_ROWS:
+            try:
+                lines.append(self._lines.get_nowait())
+            except queue.Empty:
+                break
+        return [line for line in lines if line.strip()]
+
+    def _spool(self, events):
+        new_file = not os.path.exists(self.spool_path)
+        with open(self.spool_path, 'a', encoding='utf-8', newline='') as f:
+            events.to_csv(f, header=new_file, index=False)
+
+    def _apply_batches(self):
+        while not self._stopped.wait(self.batch_seconds):
+            # A backlog is worked off in consecutive batches
+            lines = self._drain()
+            while lines:
+                self._apply(lines)
+                lines = self._drain()
+
+    def _apply(self, lines):
+        batch = pd.read_csv(io.StringIO('\n'.join(lines)), header=None, names=WEB_EVENT_COLUMNS,
+                            dtype=str, on_bad_lines='skip')
+        # Header lines (the file's first line, or one per socket client) are not events
+        batch = batch[batch['id'] != WEB_EVENT_COLUMNS[0]]
+        try:
+            with self._lock:
+                events = self.counters.apply(batch)
+                if self.spool_path and self._server is not None:
+                    self._spool(events)
+        except Exception:
+            logger.exception("Could not apply a batch of %d streamed web events", len(batch))
+
+    def start(self):
+        url = urlparse(self.source)
+        if url.scheme == 'tcp':
+            self._server = _LineServer((url.hostname, url.port), _LineHandler)
+            self._server.put = self._lines.put
+            threading.Thread(target=self._server.serve_forever, name='live-events-socket', daemon=True).start()
+        else:
+            threading.Thread(target=self._tail, args=(self.source,), name='live-events-tail', daemon=True).start()
+        threading.Thread(target=self._apply_batches, name='live-events-batches', daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def replay(csv_path, target, rate, id_offset):
+    # Send the rows of a web events CSV to a tailed file or a listening socket, `rate` rows a
+    # second, with ids moved up by `id_offset` and the current time as occurred_at
+    events = pd.read_csv(csv_path, dtype=str)
+    url = urlparse(target)
+    if url.scheme == 'tcp':
+        connection = socket.create_connection((url.hostname, url.port))
+        write = lambda text: connection.sendall(text.encode())
+        close = connection.close
+    else:
+        f = open(target, 'a', encoding='utf-8')
+        write = lambda text: (f.write(text), f.flush())
+        close = f.close
+    try:
+        for row in events.itertuples(index=False):
+            now = time.strftime('%Y-%m-%d %H:%M:%S')
+            write(f"{int(row.id) + id_offset},{row.account_id},{now},{row.channel}\n")
+            time.sleep(1 / rate)
+    finally:
+        close()
+    return len(events)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay web events into a live source of the dashboard.")
+    parser.add_argument('target', help="File the dashboard tails, or tcp://host:port it listens on")
+    parser.add_argument('--events', default=sales_data.csv_path('web_events'), help="CSV of web events to replay")
+    parser.add_argument('--rate', type=float, default=100, help="Events per second")
+    parser.add_argument('--id-offset', type=int, default=10_000_000, help="Added to every event id")
+    args = parser.parse_args()
+
+    sent = replay(args.events, args.target, args.rate, args.id_offset)
+    print(f"Sent {sent} web events to {args.target}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1643 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+import approximate
+import downsample
+import sales_data
+from query_cache import normalize_sql
+
+# A dashboard panel: the SQL it needs, how the result frames become the plotted data,
+# how that data becomes a figure, and which controls it depends on
+Panel = namedtuple('Panel', ['queries', 'data', 'figure', 'controls'], defaults=[()])
+
+# Panel settings the user can change, with the values the panels were designed with
+DEFAULT_CONTROLS = {
+    'volume_orders': (10, 50),  # plot6: moderate / high volume above these order counts
+    'high_value_usd': 1000,  # plot6: high value above this average order
+    'activity_orders': (10, 20),  # plot18: medium activity from, high activity above
+    'segment_ranks': (3, 10),  # plot17: top / moderate segments up to these ranks
+    'compare_years': (2013, 2017),  # plot13: years shown side by side
+    'approximate': False,  # plots 11, 15: distinct accounts from sketches, event totals from a sample
+}
+
+# Prepared statements kept per cursor; the least recently used one is deallocated past this
+STATEMENT_CACHE_SIZE = int(os.environ.get('SALES_STATEMENT_CACHE_SIZE', 128))
+
+
+def sql_literal(value):
+    # A parameter value as a SQL literal, for EXECUTE, which takes no client-side bind parameters
+    if value is None:
+        return 'NULL'
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, (bool, np.bool_)):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    raise TypeError(f"Unsupported query parameter {value!r}")
+
+
+class QueryRunner:
+    """Runs panel queries on a shared read-only connection, through the result cache.
+
+    Once retired in favour of a successor (the runner of a rebuilt database), calls still
+    running finish here and the connection closes after the last one; later calls, through
+    references other sessions still hold, go to the successor.
+    """
+
+    def __init__(self, con, data_version, cache, max_workers=None):
+        self.con = con
+        self.data_version = data_version
+        self.cache = cache
+        if max_workers is None:
+            max_workers = int(os.environ.get('SALES_QUERY_WORKERS', min(16, os.cpu_count() or 1)))
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='panel-query')
+        self._local = threading.local()
+        self._cursors = []
+        self._cursors_lock = threading.Lock()
+        self._calls = 0
+        self._successor = None
+        self._closed = False
+        self._calls_lock = threading.Lock()
+
+    def _cursor(self):
+        # One cursor per worker thread, since a DuckDB connection must not be shared across threads
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.con.cursor()
+            self._local.statements = OrderedDict()
+            self._local.prepared = 0
+            with self._cursors_lock:
+                self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        # Wait for running queries, then close every thread's cursor and the connection
+        with self._calls_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._executor.shutdown()
+        with self._cursors_lock:
+            for cursor in self._cursors:
+                cursor.close()
+            self._cursors.clear()
+        self.con.close()
+
+    def retire(self, successor):
+        with self._calls_lock:
+            self._successor = successor
+            idle = self._calls == 0
+        if idle:
+            self.close()
+
+    @contextmanager
+    def _use(self):
+        # This runner, counted as in use until the block ends, or its successor once retired
+        with self._calls_lock:
+            successor = self._successor
+            if successor is None:
+                self._calls += 1
+        if successor is not None:
+            yield successor
+            return
+        try:
+            yield self
+        finally:
+            with self._calls_lock:
+                self._calls -= 1
+                idle = self._successor is not None and self._calls == 0
+            if idle:
+                self.close()
+
+    def _prepared(self, cursor, query):
+        # Name of this cursor's prepared statement for `query`, preparing it on first use, so
+        # repeated panel queries skip parsing and planning
+        statements = self._local.statements
+        sql = normalize_sql(query)
+        name = statements.get(sql)
+        if name is not None:
+            statements.move_to_end(sql)
+            return name
+        self._local.prepared += 1
+        name = f'panel_stmt_{self._local.prepared}'
+        cursor.execute(f'PREPARE {name} AS {sql};')
+        statements[sql] = name
+        while len(statements) > STATEMENT_CACHE_SIZE:
+            _, evicted = statements.popitem(last=False)
+            cursor.execute(f'DEALLOCATE {evicted};')
+        return name
+
+    def _execute(self, query, params, stats):
+        started = time.perf_counter()
+        cursor = self._cursor()
+        name = self._prepared(cursor, query)
+        arguments = ', '.join(sql_literal(value) for value in params or ())
+        result = cursor.execute(f'EXECUTE {name}({arguments});' if arguments else f'EXECUTE {name};')
+        converting = time.perf_counter()
+        frame = result.df()
+        stats.update(
+            cached=False,
+            query_seconds=converting - started,
+            df_seconds=time.perf_counter() - converting
+        )
+        return frame
+
+    def run(self, query, params=None, stats=None):
+        # `stats`, if given, receives the execution and DataFrame conversion times
+        with self._use() as runner:
+            if runner is not self:
+                return runner.run(query, params, stats)
+            return self._run(query, params, stats)
+
+    def _run(self, query, params, stats):
+        if stats is None:
+            stats = {}
+        stats.update(cached=True, query_seconds=0.0, df_seconds=0.0)
+        frame = self.cache.get_or_compute(
+            query, params, self.data_version,
+            lambda: self._execute(query, params, stats)
+        )
+        stats['rows'] = len(frame)
+        return frame
+
+    def run_many(self, queries, stats=None):
+        # Execute {key: query} concurrently, each query SQL or a (SQL, parameters) pair; panels
+        # asking for the same query share one execution. `stats`, if given, receives the run
+        # stats of each key's query
+        with self._use() as runner:
+            if runner is not self:
+                return runner.run_many(queries, stats)
+            return self._run_many(queries, stats)
+
+    def _run_many(self, queries, stats):
+        requests = {
+            key: (query, ()) if isinstance(query, str) else (query[0], tuple(query[1]))
+            for key, query in queries.items()
+        }
+        query_stats = {request: {} for request in set(requests.values())}
+        futures = {
+            request: self._executor.submit(self._run, request[0], request[1], query_stats[request])
+            for request in query_stats
+        }
+        results = {key: futures[request].result() for key, request in requests.items()}
+        if stats is not None:
+            stats.update({key: query_stats[request] for key, request in requests.items()})
+        return results
+
+    def with_cursor(self, function):
+        # function(cursor) on a cursor of its own, for reads other than panel queries
+        with self._use() as runner:
+            if runner is not self:
+                return runner.with_cursor(function)
+            with self.con.cursor() as cursor:
+                return function(cursor)
+
+
+class OpenDatabase:
+    """The QueryRunner of a database file, reopened when the file is rebuilt or appended to.
+
+    `connect(db_path)` opens the file as it is now (sales_data.open_snapshot does), so the
+    new runner is opened while the previous one is still in use; the previous one is then
+    retired rather than closed. Changes to the `watch` paths (e.g. a directory of exports
+    `connect` reads from) reopen it too.
+    """
+
+    def __init__(self, db_path, cache, connect=sales_data.open_snapshot, watch=()):
+        self.db_path = db_path
+        self.cache = cache
+        self.connect = connect
+        self.watch = list(watch)
+        self._mtime = None
+        self._runner = None
+        self._lock = threading.Lock()
+
+    def runner(self):
+        with self._lock:
+            mtime = (os.path.getmtime(self.db_path),
+                     *(os.path.getmtime(path) if os.path.exists(path) else None for path in self.watch))
+            if mtime != self._mtime:
+                con = self.connect(self.db_path)
+                runner = QueryRunner(con, sales_data.read_data_version(con), self.cache)
+                if self._runner is not None:
+                    self._runner.retire(runner)
+                self._runner, self._mtime = runner, mtime
+            return self._runner
+
+
+def bucket(conditions):
+    # Vectorized CASE WHEN over nested conditions (each one implies the next): 0 where the
+    # first holds, 1 where only the ones after it hold, ..., len(conditions) where none does
+    codes = np.full(len(conditions[0]), len(conditions), dtype=np.intp)
+    for condition in conditions:
+        codes -= condition
+    return codes
+
+
+def segment_totals(codes, sizes, values):
+    # Per-segment SQL-style COUNT(x) and SUM(x), which skip missing values; `sizes` is
+    # np.bincount(codes), so only the (few) missing rows need counting
+    missing = np.isnan(values)
+    return (
+        sizes - np.bincount(codes[missing], minlength=len(sizes)),
+        np.bincount(codes, weights=np.where(missing, 0, values), minlength=len(sizes)),
+    )
+
+
+def segment_average(codes, sizes, values):
+    counts, sums = segment_totals(codes, sizes, values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def region_filter(region_choice, column='region_name'):
+    # (predicate, parameters) keeping the chosen region's rows. "All Regions" gets a constant
+    # TRUE, which the optimizer drops, so unfiltered queries scan without any filter
+    if region_choice == 'All Regions':
+        return 'TRUE', []
+    return f'{column} = ?', [region_choice]
+
+
+def approximate_queries(by, where, params):
+    # Register histograms of the merged HyperLogLog sketches per `by` group (for all accounts,
+    # and for the named ones only), event counts from the web event sample, and the rate
+    # events entered the sample at
+    groups = ', '.join(by)
+    accounts = f"""
+    WITH registers AS (
+        SELECT {groups},
+               register,
+               MAX(rank) AS rank,
+               MAX(rank) FILTER (WHERE named) AS named_rank
+        FROM web_event_hll
+        WHERE {where}
+        GROUP BY {groups}, register
+    )
+    SELECT {groups}, FALSE AS named_only, rank, COUNT(*) AS registers
+    FROM registers
+    GROUP BY {groups}, rank
+    UNION ALL
+    SELECT {groups}, TRUE AS named_only, named_rank AS rank, COUNT(*) AS registers
+    FROM registers
+    WHERE named_rank IS NOT NULL
+    GROUP BY {groups}, named_rank;
+    """
+    events = f"""
+    SELECT {groups},
+           COUNT(*) AS sampled_events
+    FROM web_event_sample
+    WHERE {where}
+    GROUP BY {groups};
+    """
+    # A sample holding fewer rows than it can is every event there is
+    inclusion = f"""
+    SELECT CASE WHEN COUNT(*) < {sales_data.WEB_EVENT_SAMPLE_ROWS} THEN 1.0 ELSE MAX(sample_key) END AS inclusion
+    FROM web_event_sample;
+    """
+    return {'accounts': (accounts, params), 'events': (events, params), 'inclusion': inclusion}
+
+
+def approximate_counts(results, by):
+    # Estimated total_events, unique_accounts and named_accounts per `by` group, each with
+    # its 95% interval half-width in <column>_error
+    registers = results['accounts']
+    counts = registers.loc[~registers['named_only'], by].drop_duplicates(ignore_index=True)
+    for column, named_only in [('unique_accounts', False), ('named_accounts', True)]:
+        estimates = approximate.distinct_counts(registers[registers['named_only'] == named_only], by)
+        counts = counts.merge(
+            estimates.rename(columns={'estimate': column, 'error': f'{column}_error'}), on=by, how='left')
+        counts[column] = counts[column].fillna(0).round().astype('int64')
+        counts[f'{column}_error'] = counts[f'{column}_error'].fillna(0.0)
+
+    events = results['events']
+    estimate, error = approximate.sample_total(events['sampled_events'], results['inclusion']['inclusion'].iloc[0])
+    events = events[by].assign(total_events=estimate.round().astype('int64'), total_events_error=error)
+    counts = counts.merge(events, on=by, how='left')
+    counts['total_events'] = counts['total_events'].fillna(0).astype('int64')
+    counts['total_events_error'] = counts['total_events_error'].fillna(0.0)
+    return approximate.estimated(counts)
+
+
+def select_region(frame, region_choice, by, maxes=()):
+    # Answer a panel from per-region cube rows: keep the chosen region, or roll every
+    # region up for "All Regions" (max for the `maxes` columns, sum for the rest)
+    if region_choice != "All Regions":
+        return frame[frame['region_name'] == region_choice].reset_index(drop=True)
+    aggregations = {
+        column: 'max' if column in maxes else 'sum'
+        for column in frame.columns if column not in by and column != 'region_name'
+    }
+    return frame.groupby(by, as_index=False, dropna=False).agg(aggregations)
+
+
+def split_groups(frame, by):
+    # Yield (value, rows) for each value of `by`, in order of first appearance. Grouping once
+    # keeps trace construction linear; filtering the frame per value costs rows x groups
+    codes, values = pd.factorize(frame[by])
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes[codes >= 0], minlength=len(values)))[:-1]
+    for value, rows in zip(values, np.split(order[np.count_nonzero(codes < 0):], bounds)):
+        yield value, frame.iloc[rows]
+
+
+#plot1
+def plot1_queries(region_choice, controls):
+    query = """
+    SELECT region_name,
+            SUM(total_amt_usd) AS total_sales,
+            SUM(order_count) AS order_count
+    FROM order_cube
+    GROUP BY region_name
+    ORDER BY total_sales DESC;
+    """
+    return {'region_totals': query}
+
+
+def plot1_data(results, region_choice, controls):
+    region_totals = results['region_totals']
+    if region_choice == "All Regions":
+        return region_totals
+    return region_totals[region_totals['region_name'] == region_choice]
+
+
+def plot1_figure(region_sales_data, region_choice):
+    # Total sales for the selected region or sum for all regions
+    if region_choice == "All Regions":
+        total_sales = region_sales_data["total_sales"].sum().round()  # Sum all regions for "All Regions"
+    else:
+        total_sales = region_sales_data["total_sales"].iloc[0].round()  # Get sales for the selected region
+
+    # Create an indicator chart
+    fig1 = go.Figure()
+
+    fig1.add_trace(go.Indicator(
+        mode="number",
+        value=total_sales,
+        title={"text": f"Total Sales Amount - {region_choice}"},
+        number={'prefix': "$", 'valueformat': ".f"},
+        domain={'x': [0, 1], 'y': [0, 1]}  # Full-width domain
+    ))
+
+        # Update layout for transparency and styling
+    fig1.update_layout(
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        font=dict(size=24, color="darkgreen")  # Styling for the text
+    )
+    return fig1
+
+
+# plot2 - Accounts by Sales Rep
+def plot2_queries(region_choice, controls):
+    where, params = region_filter(region_choice, 'r.name')
+    query = f"""
+    SELECT sr.name AS Rep_name,
+            COUNT(*) AS Account_Count
+    FROM region r
+    JOIN sales_reps sr ON r.id = sr.region_id
+    JOIN accounts a ON sr.id = a.sales_rep_id
+    WHERE {where}
+    GROUP BY sr.name
+    ORDER BY Rep_name;
+    """
+    return {'accounts': (query, params)}
+
+
+def plot2_data(results, region_choice, controls):
+    return results['accounts']
+
+
+def plot2_figure(grouped_data, region_choice):
+    fig2 = px.bar(
+        grouped_data,
+        x='Rep_name',
+        y='Account_Count',
+        title=f"{region_choice}: Accounts by Sales Rep",
+        labels={'Rep_name': 'Sales Representative', 'Account_Count': 'Number of Accounts'},
+        text='Account_Count',
+        color='Account_Count',
+        color_continuous_scale='Blues'
+    )
+    fig2.update_traces(textposition='outside')
+    fig2.update_layout(
+        xaxis_title="Sales Representative",
+        yaxis_title="Number of Accounts",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)'
+    )
+    return fig2
+
+
+#Plot3
+def plot3_queries(region_choice, controls):
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT sales_rep_name,
+            channel,
+            CAST(SUM(event_count) AS BIGINT) AS number_of_occurrences
+    FROM web_event_cube
+    WHERE {where}
+    GROUP BY sales_rep_name, channel
+    ORDER BY number_of_occurrences DESC;
+    """
+    return {'web_events': (query, params)}
+
+
+def plot3_data(results, region_choice, controls):
+    web_event_data = results['web_events']
+    return web_event_data.pivot(index='sales_rep_name', columns='channel', values='number_of_occurrences').fillna(0)
+
+
+def plot3_figure(pivot_data, region_choice):
+    fig3 = go.Figure()
+    for channel in pivot_data.columns:
+        fig3.add_trace(go.Bar(
+            x=pivot_data.index,
+            y=pivot_data[channel],
+            name=channel
+        ))
+
+    fig3.update_layout(
+        title=f"{region_choice}: Web Event Occurrences by Sales Representative and Channel",
+        xaxis_title="Sales Representative",
+        yaxis_title="Number of Occurrences",
+        barmode='stack',
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis_tickangle=-45,
+        legend_title_text='Channel'
+    )
+    return fig3
+
+
+#plot4
+def plot4_queries(region_choice, controls):
+    # Accounts per rep and the year of their earliest first order, from the per-account rollup
+    # instead of a distinct count over every order
+    where, params = region_filter(region_choice, 'r.name')
+    query = f"""
+    SELECT sr.name AS sales_representative,
+            COUNT(s.account_id) AS new_customers_acquired,
+            CAST(MIN(year(s.first_order_at)) AS INTEGER) AS first_order_year
+    FROM sales_reps sr
+    LEFT JOIN account_stats s ON sr.id = s.sales_rep_id
+    LEFT JOIN region r ON sr.region_id = r.id
+    WHERE {where}
+    GROUP BY sr.name
+    ORDER BY new_customers_acquired DESC, sales_representative;
+    """
+    return {'acquisition': (query, params)}
+
+
+def plot4_data(results, region_choice, controls):
+    return results['acquisition']
+
+
+def plot4_figure(acquisition_data, region_choice):
+    fig4 = go.Figure()
+
+    for i, (rep, rep_data) in enumerate(split_groups(acquisition_data, 'sales_representative')):
+        fig4.add_trace(go.Scatter(
+            x=rep_data['first_order_year'],
+            y=rep_data['new_customers_acquired'],
+            mode='markers',
+            name=rep,
+            marker=dict(
+                size=12,
+                color=f'rgba({(i * 50) % 255}, {(i * 80) % 255}, {(i * 100) % 255}, 0.8)',
+                line=dict(width=1.5, color='black')
+            ),
+            hovertemplate=(
+                f"<b>Sales Rep:</b> {rep}<br>"
+                "<b>Year of First Order:</b> %{x}<br>"
+                "<b>New Customers Acquired:</b> %{y}<extra></extra>"
+            )
+        ))
+
+    fig4.update_layout(
+        title=f"Customer Acquisition Analysis by Sales Rep ({region_choice})",
+        xaxis_title="Year of First Order",
+        yaxis_title="New Customers Acquired",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis=dict(tickmode='linear', dtick=1),
+        showlegend=True
+    )
+    return fig4
+
+
+#plot5
+# Average order size per region, derived from plot1's per-region totals
+plot5_queries = plot1_queries
+
+
+def plot5_data(results, region_choice, controls):
+    avg_order_data = plot1_data(results, region_choice, controls)
+    return avg_order_data.assign(
+        avg_order_size=avg_order_data['total_sales'] / avg_order_data['order_count']
+    ).sort_values('avg_order_size', ascending=False)
+
+
+def plot5_figure(avg_order_data, region_choice):
+    fig5 = go.Figure()
+
+    fig5.add_trace(go.Bar(
+        x=avg_order_data['avg_order_size'],
+        y=avg_order_data['region_name'],
+        orientation='h',
+        marker=dict(
+            color=avg_order_data['avg_order_size'],
+            colorscale='blues',
+            showscale=True,
+            colorbar=dict(
+                title='Avg Order Size (USD)',
+                titlefont=dict(size=14, color='white'),
+                tickfont=dict(size=12, color='white')
+            )
+        ),
+        text=avg_order_data['avg_order_size'].apply(lambda x: f"${x:,.2f}"),
+        textposition='inside',
+        insidetextanchor='middle'
+    ))
+
+    fig5.update_layout(
+        title=dict(
+            text="Average Order Size Comparison Across Regions",
+            font=dict(size=18, color='white')
+        ),
+        xaxis=dict(
+            title="Average Order Size (USD)",
+            titlefont=dict(size=14, color='white'),
+            tickfont=dict(size=12, color='white'),
+            gridcolor='rgba(255, 255, 255, 0.1)'
+        ),
+        yaxis=dict(
+            title="Region",
+            titlefont=dict(size=14, color='white'),
+            tickfont=dict(size=12, color='white'),
+            automargin=True
+        ),
+        font=dict(size=14, color='white'),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        bargap=0.2
+    )
+    return fig5
+
+
+# Plot6
+def plot6_queries(region_choice, controls):
+    # Per-account measures; the segments are cut in plot6_data so thresholds can change without SQL
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT
+        order_count,
+        avg_amt_usd,
+        stddev_amt_usd,
+        CAST(total_amt_usd AS DOUBLE) AS total_amt_usd
+    FROM account_stats
+    WHERE {where};
+    """
+    return {'accounts': (query, params)}
+
+
+volume_segments = ['High Volume', 'Moderate Volume', 'Low Volume']
+value_segments = ['High Value', 'Low Value']
+
+
+def plot6_data(results, region_choice, controls):
+    accounts = results['accounts']
+    moderate_orders, high_orders = controls['volume_orders']
+    order_count = accounts['order_count'].to_numpy()
+    avg_amt = accounts['avg_amt_usd'].to_numpy()
+
+    # Segment code = volume * 2 + value
+    volume = bucket([order_count > high_orders, order_count > moderate_orders])
+    value = bucket([avg_amt > controls['high_value_usd']])
+    codes = volume * len(value_segments) + value
+    segments = len(volume_segments) * len(value_segments)
+
+    num_accounts = np.bincount(codes, minlength=segments)
+    sales_counts, sales = segment_totals(codes, num_accounts, accounts['total_amt_usd'].to_numpy())
+    present = np.flatnonzero(num_accounts)
+    return pd.DataFrame({
+        'order_volume_segment': [volume_segments[code // len(value_segments)] for code in present],
+        'order_value_segment': [value_segments[code % len(value_segments)] for code in present],
+        'num_accounts': num_accounts[present],
+        'avg_order_size_usd': segment_average(codes, num_accounts, avg_amt)[present],
+        'avg_order_std_dev_usd': segment_average(codes, num_accounts, accounts['stddev_amt_usd'].to_numpy())[present],
+        'total_sales_in_segment': np.where(sales_counts > 0, sales, np.nan)[present],
+    }).sort_values('num_accounts', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def plot6_figure(avg_order_size_data, region_choice):
+    fig6 = go.Figure()
+
+    fig6.add_trace(go.Bar(
+        x=avg_order_size_data['order_volume_segment'] + " - " + avg_order_size_data['order_value_segment'],
+        y=avg_order_size_data['avg_order_size_usd'],
+        name='Avg Order Size (USD)',
+        marker=dict(color='rgb(53, 151, 255)'),
+    ))
+
+    fig6.add_trace(go.Bar(
+        x=avg_order_size_data['order_volume_segment'] + " - " + avg_order_size_data['order_value_segment'],
+        y=avg_order_size_data['num_accounts'],
+        name='Number of Accounts',
+        marker=dict(color='rgb(255, 130, 50)'),
+    ))
+
+    fig6.add_trace(go.Bar(
+        x=avg_order_size_data['order_volume_segment'] + " - " + avg_order_size_data['order_value_segment'],
+        y=avg_order_size_data['total_sales_in_segment'],
+        name='Total Sales (USD)',
+        marker=dict(color='rgb(255, 99, 132)'),
+    ))
+
+    fig6.add_trace(go.Bar(
+        x=avg_order_size_data['order_volume_segment'] + " - " + avg_order_size_data['order_value_segment'],
+        y=avg_order_size_data['avg_order_std_dev_usd'],
+        name='Order Std. Dev. (USD)',
+        marker=dict(color='rgb(75, 192, 192)'),
+    ))
+
+    fig6.update_layout(
+        barmode='group',
+        title=f"Analysis of Order Size, Number of Accounts, and Total Sales by Segment ({region_choice})",
+        xaxis_title="Customer Segment",
+        yaxis_title="Values (USD / Accounts)",
+        legend_title="Metrics",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)', 
+        plot_bgcolor='rgba(0,0,0,0)',
+    )
+    return fig6
+
+
+#plot7
+def plot7_queries(region_choice, controls):
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT region_name AS region,
+            account_name,
+            total_amt_usd / (total + 0.01) AS unit_price
+    FROM order_facts
+    WHERE standard_qty > 100
+        AND poster_qty > 50
+        AND {where}
+    ORDER BY unit_price DESC;
+    """
+    return {'unit_prices': (query, params)}
+
+
+def plot7_data(results, region_choice, controls):
+    unit_prices = results['unit_prices'][['account_name', 'unit_price']]
+    # Past the chart's point budget, one bar per order becomes a histogram of unit prices
+    budget = downsample.point_budget('plot7')
+    if len(unit_prices) <= budget:
+        return unit_prices
+    bins = downsample.histogram(unit_prices['unit_price'], max_bins=budget)
+    return downsample.reduced(bins, len(unit_prices), 'orders')
+
+
+def plot7_figure(region_data_sorted, region_choice):
+    title = f"{region_choice}: Unit Price for Orders with Quantity Conditions"
+    if 'count' in region_data_sorted.columns:
+        fig7 = px.bar(
+            region_data_sorted,
+            x='bin_center',
+            y='count',
+            title=title + downsample.reduced_note(region_data_sorted),
+            labels={'bin_center': 'Unit Price (USD)', 'count': 'Orders',
+                    'bin_start': 'From (USD)', 'bin_end': 'To (USD)'},
+            hover_data=['bin_start', 'bin_end'],
+            color='bin_center',
+            color_continuous_scale='Viridis'
+        )
+        fig7.update_traces(width=region_data_sorted['bin_end'] - region_data_sorted['bin_start'])
+        x_title, y_title = "Unit Price (USD)", "Orders"
+    else:
+        fig7 = px.bar(
+            region_data_sorted,
+            x='account_name',
+            y='unit_price',
+            title=title,
+            labels={'account_name': 'Account Name', 'unit_price': 'Unit Price (USD)'},
+            color='unit_price',
+            color_continuous_scale='Viridis'
+        )
+        x_title, y_title = "Account Name", "Unit Price (USD)"
+    fig7.update_traces(textposition='outside')
+    fig7.update_layout(
+        xaxis_title=x_title,
+        yaxis_title=y_title,
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis_tickangle=-45
+    )
+    return fig7
+
+
+#plot8
+def plot8_queries(region_choice, controls):
+    query = """
+    SELECT region_name,
+            year,
+            SUM(total_amt_usd) AS total_usd
+    FROM order_cube
+    GROUP BY region_name, year;
+    """
+    return {'yearly': query}
+
+
+def plot8_data(results, region_choice, controls):
+    yearly_order_data = select_region(results['yearly'], region_choice, by=['year'])
+    return yearly_order_data.sort_values('total_usd').reset_index(drop=True)
+
+
+def plot8_figure(yearly_order_data, region_choice):
+    fig8 = go.Figure()
+
+    fig8.add_trace(go.Scatter(
+        x=yearly_order_data['year'],
+        y=yearly_order_data['total_usd'],
+        mode='lines+markers',
+        fill='tozeroy',
+        line=dict(color='mediumslateblue', width=3),
+        marker=dict(color='darkorange', size=8, symbol='diamond'),
+        name='Total USD'
+    ))
+
+    fig8.update_layout(
+        title=f"Total USD Amount of Orders by Year ({region_choice})",
+        xaxis_title="Year",
+        yaxis_title="Total USD Amount (in millions)",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis_tickangle=-45,
+        showlegend=True
+    )
+
+    min_value = yearly_order_data.loc[yearly_order_data['total_usd'].idxmin()]
+    max_value = yearly_order_data.loc[yearly_order_data['total_usd'].idxmax()]
+    fig8.add_annotation(x=min_value['year'], y=min_value['total_usd'],
+                        text=f"Lowest: ${min_value['total_usd']:.2f}",
+                        showarrow=True, arrowhead=2, ax=-40, ay=-40, bgcolor="blue")
+    fig8.add_annotation(x=max_value['year'], y=max_value['total_usd'],
+                        text=f"Highest: ${max_value['total_usd']:.2f}",
+                        showarrow=True, arrowhead=2, ax=40, ay=-40, bgcolor="green")
+    return fig8
+
+
+#Plot9
+def plot9_queries(region_choice, controls):
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT account_id,
+            account_name,
+            total_amt_usd AS total_spent,
+            order_count AS total_orders,
+            avg_amt_usd AS average_order_amount
+    FROM account_stats
+    WHERE {where}
+    ORDER BY total_spent DESC;
+    """
+    return {'clv': (query, params)}
+
+
+def plot9_data(results, region_choice, controls):
+    clv_data = results['clv']
+    clv_data = clv_data.assign(average_order_amount=clv_data['average_order_amount'].fillna(1))
+    # Past the chart's point budget, keep the accounts that shape the scatter: LTTB along the
+    # order count axis keeps the extremes of spend at every order count
+    budget = downsample.point_budget('plot9')
+    if len(clv_data) <= budget:
+        return clv_data
+    shown = clv_data.dropna(subset=['total_spent']).sort_values(['total_orders', 'total_spent'], kind='stable')
+    keep = downsample.lttb(shown['total_orders'], shown['total_spent'], budget)
+    return downsample.reduced(shown.iloc[keep].reset_index(drop=True), len(clv_data), 'accounts')
+
+
+def plot9_figure(clv_data, region_choice):
+    fig9 = px.scatter(
+        clv_data,
+        x="total_orders",
+        y="total_spent",
+        size="average_order_amount",
+        color="total_spent",
+        hover_data=["account_name"],
+        labels={
+            "total_orders": "Total Orders",
+            "total_spent": "Total Spent (USD)",
+            "average_order_amount": "Avg Order Amount (USD)"
+        },
+        title=f"Customer Lifetime Value Analysis - {region_choice}" + downsample.reduced_note(clv_data),
+        color_continuous_scale="Viridis",
+        render_mode='webgl' if len(clv_data) > downsample.WEBGL_POINTS else 'svg'
+    )
+
+    fig9.update_layout(
+        xaxis_title="Total Orders",
+        yaxis_title="Total Spent (USD)",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis_tickangle=-45
+    )
+    return fig9
+
+
+#plot10
+def plot10_queries(region_choice, controls):
+    # Accounts with any order count as active, the rest as churned
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT
+        COUNT(last_order_at) AS active_customers,
+        COUNT(*) - COUNT(last_order_at) AS churned_customers
+    FROM account_stats
+    WHERE {where};
+    """
+    return {'churn': (query, params)}
+
+
+def plot10_data(results, region_choice, controls):
+    return results['churn']
+
+
+def plot10_figure(churn_data, region_choice):
+    active_customers = churn_data['active_customers'][0]
+    churned_customers = churn_data['churned_customers'][0]
+
+    fig10 = go.Figure()
+
+    fig10.add_trace(go.Bar(
+        x=[active_customers],
+        y=['Active Customers'],
+        orientation='h',
+        name='Active Customers',
+        marker=dict(color='green', line=dict(color='darkgreen', width=1.5)),
+        hovertemplate="Active Customers: %{x}<extra></extra>"
+    ))
+
+    fig10.add_trace(go.Bar(
+        x=[churned_customers],
+        y=['Churned Customers'],
+        orientation='h',
+        name='Churned Customers',
+        marker=dict(color='red', line=dict(color='darkred', width=1.5)),
+        hovertemplate="Churned Customers: %{x}<extra></extra>"
+    ))
+
+    fig10.update_layout(
+        title=f"Customer Churn Analysis ({region_choice})",
+        xaxis_title="Number of Customers",
+        yaxis_title="Customer Status",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        barmode='stack',
+        showlegend=True
+    )
+    return fig10
+
+
+#plot11
+def plot11_queries(region_choice, controls):
+    where, params = region_filter(region_choice)
+    if controls['approximate']:
+        return approximate_queries(['region_name', 'channel'], where, params)
+    query = f"""
+    SELECT
+        region_name,
+        channel,
+        CAST(SUM(event_count) AS BIGINT) AS total_events,
+        COUNT(DISTINCT account_id) AS unique_accounts_impacted
+    FROM web_event_cube
+    WHERE {where}
+    GROUP BY region_name, channel
+    ORDER BY region_name, total_events DESC;
+    """
+    return {'web_events': (query, params)}
+
+
+def plot11_data(results, region_choice, controls):
+    if 'web_events' in results:
+        return results['web_events']
+    counts = approximate_counts(results, ['region_name', 'channel'])
+    counts = counts.rename(columns={
+        'unique_accounts': 'unique_accounts_impacted',
+        'unique_accounts_error': 'unique_accounts_impacted_error',
+    })
+    counts = counts.sort_values(['region_name', 'total_events'], ascending=[True, False], ignore_index=True)
+    return counts[['region_name', 'channel', 'total_events', 'unique_accounts_impacted',
+                   'total_events_error', 'unique_accounts_impacted_error']]
+
+
+def plot11_figure(web_event_data, region_choice):
+    fig11 = go.Figure()
+    channel_colors = {
+        'direct': 'rgba(255, 99, 132, 0.6)',
+        'facebook': 'rgba(54, 162, 235, 0.6)',
+        'organic': 'rgba(75, 192, 192, 0.6)',
+        'adwords': 'rgba(153, 102, 255, 0.6)',
+        'twitter': 'rgba(255, 159, 64, 0.6)',
+        'banner': 'rgba(255, 205, 86, 0.6)'
+    }
+
+    for channel, channel_data in split_groups(web_event_data, 'channel'):
+        unique_accounts = channel_data['unique_accounts_impacted'].astype(str)
+        if 'unique_accounts_impacted_error' in channel_data.columns:
+            unique_accounts = "~" + unique_accounts + " ±" + channel_data['unique_accounts_impacted_error'].round().astype(int).astype(str)
+        fig11.add_trace(go.Bar(
+            x=channel_data['region_name'],
+            y=channel_data['total_events'],
+            error_y=approximate.error_bars(channel_data, 'total_events'),
+            name=f'Channel: {channel}',
+            text="Unique Accounts: " + unique_accounts,
+            textposition='inside',
+            hoverinfo='x+text+y',
+            marker=dict(
+                color=channel_colors[channel],  # Use the predefined color for each channel
+                line=dict(color='white', width=1),  # White outline for better visibility
+            )
+        ))
+
+    # Update layout for better visualization
+    fig11.update_layout(
+        title=f"Web Event Effectiveness by Region and Channel{approximate.note(web_event_data)}",
+        xaxis=dict(
+            title="Region",
+            titlefont=dict(size=14, color='white'),
+            tickfont=dict(size=12, color='white'),
+            tickangle=45,  # Rotate x-axis labels for better readability
+        ),
+        yaxis=dict(
+            title="Total Events",
+            titlefont=dict(size=14, color='white'),
+            tickfont=dict(size=12, color='white')
+        ),
+        barmode='stack',  # Stack bars to combine events of each channel per region
+        font=dict(size=14, color='white'),
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot area
+        legend=dict(
+            title="Channels",
+            orientation="v",  # Vertical orientation for the legend
+            x=1.05,  # Position legend to the right
+            y=0.5,  # Center the legend vertically
+            xanchor="left",
+            yanchor="middle",
+            traceorder='normal',  # Order items in the legend
+            font=dict(size=12, color='white'),
+            bgcolor='rgba(0,0,0,0)',  # Transparent background for the legend
+            bordercolor='white',  # White border around the legend
+            borderwidth=1
+        ),
+        showlegend=True
+    )
+    return fig11
+
+
+#plot12
+def plot12_queries(region_choice, controls):
+    # Contributions are within a region, so the region filter applies before aggregating
+    where, params = region_filter(region_choice)
+    query = f"""
+    WITH sales_contribution AS (
+    SELECT
+        region_name,
+        sales_rep_name AS sales_representative,
+        COUNT(order_id) AS num_orders,
+        SUM(total_amt_usd) AS total_amt_usd
+    FROM order_facts
+    WHERE {where}
+    GROUP BY region_name, sales_rep_name
+    ),
+    region_total_sales AS (
+    SELECT
+        region_name,
+        SUM(total_amt_usd) AS region_total_amt_usd
+    FROM sales_contribution
+    GROUP BY region_name
+    )
+    SELECT
+    sc.region_name,
+    sc.sales_representative,
+    sc.num_orders,
+    sc.total_amt_usd,
+    rt.region_total_amt_usd,
+    ROUND(sc.total_amt_usd / rt.region_total_amt_usd * 100, 2) AS contribution_percent_of_region
+    FROM sales_contribution sc
+    JOIN region_total_sales rt ON sc.region_name = rt.region_name
+    ORDER BY sc.region_name, contribution_percent_of_region DESC;
+    """
+    return {'contribution': (query, params)}
+
+
+def plot12_data(results, region_choice, controls):
+    return results['contribution']
+
+
+def plot12_figure(sales_contribution_data, region_choice):
+    # Create the bar chart
+    fig12 = px.bar(
+        sales_contribution_data,
+        x='sales_representative',
+        y='contribution_percent_of_region',
+        color='sales_representative',
+        text='sales_representative',
+        title=f"Sales Contribution by Sales Rep and Region ({region_choice})",
+        labels={
+            'sales_representative': 'Sales Representative',
+            'contribution_percent_of_region': 'Contribution (%)'
+        },
+        hover_data=['num_orders', 'total_amt_usd'],  # Show additional data on hover
+    )
+
+    # Update layout for the bar chart
+    fig12.update_layout(
+        xaxis_title='Sales Representative',
+        yaxis_title='Contribution Percentage (%)',
+        title_font=dict(size=16, color='white'),
+        font=dict(size=14, color='white'),
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot area
+        showlegend=False  # Hide legend for clarity
+    )
+    return fig12
+
+
+#plot13
+def plot13_queries(region_choice, controls):
+    # One placeholder per selected year; no years selected leaves an empty chart
+    years = list(controls['compare_years'])
+    query = f"""
+    SELECT region_name,
+           year,
+           month,
+           SUM(total_amt_usd) AS total_usd,
+           SUM(order_count) AS total_orders,
+           MAX(max_total_amt_usd) AS max_order_amt
+    FROM order_cube
+    WHERE year IN ({', '.join('?' * len(years)) or 'NULL'})
+    GROUP BY region_name, year, month;
+    """
+    return {'year_month': (query, years)}
+
+
+def plot13_data(results, region_choice, controls):
+    year_month_data = select_region(results['year_month'], region_choice, by=['year', 'month'], maxes=['max_order_amt'])
+
+    # Prepare data for visualization
+    year_month_data['avg_order_amt'] = year_month_data['total_usd'] / year_month_data['total_orders']
+    year_month_data['month'] = year_month_data['month'].apply(lambda x: f"{x:02d}")  # Format month as two digits
+    year_month_data['year_month'] = year_month_data['year'].astype(str) + "-" + year_month_data['month']
+
+    # Ensure that the x-axis is ordered correctly
+    return year_month_data.sort_values(by=['year', 'month'])
+
+
+def plot13_figure(year_month_data, region_choice):
+    # Create a figure
+    fig13 = go.Figure()
+
+    # Add Line Plot for Total USD
+    fig13.add_trace(go.Scatter(
+        x=year_month_data['year_month'],
+        y=year_month_data['total_usd'],
+        mode='lines+markers',
+        name='Total USD',
+        line=dict(color='rgb(53, 151, 255)', width=2),
+        marker=dict(color='rgb(53, 151, 255)', size=8)
+    ))
+
+    # Add Line Plot for Average Order Amount
+    fig13.add_trace(go.Scatter(
+        x=year_month_data['year_month'],
+        y=year_month_data['avg_order_amt'],
+        mode='lines+markers',
+        name='Average Order Amount (USD)',
+        line=dict(color='rgb(255, 130, 50)', width=2),
+        marker=dict(color='rgb(255, 130, 50)', size=8)
+    ))
+
+    # Add Line Plot for Total Orders
+    fig13.add_trace(go.Scatter(
+        x=year_month_data['year_month'],
+        y=year_month_data['total_orders'],
+        mode='lines+markers',
+        name='Total Orders',
+        line=dict(color='rgb(255, 99, 132)', width=2),
+        marker=dict(color='rgb(255, 99, 132)', size=8)
+    ))
+
+    # Add Line Plot for Max Order Amount
+    fig13.add_trace(go.Scatter(
+        x=year_month_data['year_month'],
+        y=year_month_data['max_order_amt'],
+        mode='lines+markers',
+        name='Max Order Amount (USD)',
+        line=dict(color='rgb(54, 162, 235)', width=2),
+        marker=dict(color='rgb(54, 162, 235)', size=8)
+    ))
+
+    # Update layout for better visualization
+    fig13.update_layout(
+        title=f"Order Trends by Year and Month ({region_choice})",
+        xaxis_title="Year-Month",
+        yaxis_title="Amount / Number of Orders",
+        xaxis_tickangle=-45,
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot area
+        showlegend=True
+    )
+    return fig13
+
+
+#plot14
+def plot14_queries(region_choice, controls):
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT 
+        account_name,
+        AVG(standard_amt_usd) AS avg_standard_amt_usd,
+        AVG(gloss_amt_usd) AS avg_gloss_amt_usd,
+        AVG(poster_amt_usd) AS avg_poster_amt_usd,
+        COUNT(*) AS order_count
+    FROM order_facts
+    WHERE {where}
+    GROUP BY account_name;
+    """
+    return {'account_averages': (query, params)}
+
+
+def plot14_data(results, region_choice, controls):
+    account_averages = results['account_averages']
+    # Three traces share the account axis; past the chart's point budget the accounts with the
+    # largest average orders are kept and the rest averaged into one "Other" point
+    accounts = downsample.point_budget('plot14') // 3
+    amounts = ['avg_standard_amt_usd', 'avg_gloss_amt_usd', 'avg_poster_amt_usd']
+    return downsample.top_n(
+        account_averages, 'account_name', accounts,
+        rank_by=account_averages[amounts].sum(axis=1), means=amounts, weight='order_count', unit='accounts'
+    )
+
+
+def plot14_figure(avg_order_data, region_choice):
+    # Prepare data for visualization
+    fig14 = go.Figure()
+    scatter = downsample.scatter_type(len(avg_order_data))
+
+    # Add traces for each type of order amount
+    fig14.add_trace(scatter(
+        x=avg_order_data['account_name'],
+        y=avg_order_data['avg_standard_amt_usd'],
+        mode='lines+markers',
+        name='Avg Standard Amt (USD)',
+        line=dict(color='royalblue'),
+        marker=dict(symbol='circle')
+    ))
+
+    fig14.add_trace(scatter(
+        x=avg_order_data['account_name'],
+        y=avg_order_data['avg_gloss_amt_usd'],
+        mode='lines+markers',
+        name='Avg Gloss Amt (USD)',
+        line=dict(color='green'),
+        marker=dict(symbol='square')
+    ))
+
+    fig14.add_trace(scatter(
+        x=avg_order_data['account_name'],
+        y=avg_order_data['avg_poster_amt_usd'],
+        mode='lines+markers',
+        name='Avg Poster Amt (USD)',
+        line=dict(color='orange'),
+        marker=dict(symbol='diamond')
+    ))
+
+    # Update the layout for better visualization
+    fig14.update_layout(
+        title=f"{region_choice}: Average Order Amounts by Account Name" + downsample.reduced_note(avg_order_data),
+        xaxis_title="Account Name",
+        yaxis_title="Average Order Amount (USD)",
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        xaxis_tickangle=-45,  # Rotate x-axis labels for better readability
+        showlegend=True
+    )
+    return fig14
+
+
+#plot15
+def plot15_queries(region_choice, controls):
+    where, params = region_filter(region_choice)
+    if controls['approximate']:
+        return approximate_queries(['channel'], where, params)
+    query = f"""
+    SELECT channel,
+            CAST(SUM(event_count) AS BIGINT) AS total_events,
+            COUNT(DISTINCT account_id) AS unique_accounts,
+            COUNT(DISTINCT account_id) FILTER (WHERE account_name IS NOT NULL) AS total_customers
+    FROM web_event_cube
+    WHERE {where}
+    GROUP BY channel
+    ORDER BY total_events DESC;
+    """
+    return {'channels': (query, params)}
+
+
+def plot15_data(results, region_choice, controls):
+    if 'channels' in results:
+        return results['channels']
+    counts = approximate_counts(results, ['channel'])
+    counts = counts.rename(columns={'named_accounts': 'total_customers', 'named_accounts_error': 'total_customers_error'})
+    counts = counts.sort_values('total_events', ascending=False, ignore_index=True)
+    return counts[['channel', 'total_events', 'unique_accounts', 'total_customers',
+                   'total_events_error', 'unique_accounts_error', 'total_customers_error']]
+
+
+def plot15_figure(channel_data, region_choice):
+    # Create a bar chart for Channel Effectiveness Analysis
+    fig15 = go.Figure()
+
+    # Add bars for total events
+    fig15.add_trace(go.Bar(
+        x=channel_data['channel'],
+        y=channel_data['total_events'],
+        error_y=approximate.error_bars(channel_data, 'total_events'),
+        name='Total Events',
+        marker_color='indianred'
+    ))
+
+    # Add bars for unique accounts
+    fig15.add_trace(go.Bar(
+        x=channel_data['channel'],
+        y=channel_data['unique_accounts'],
+        error_y=approximate.error_bars(channel_data, 'unique_accounts'),
+        name='Unique Accounts',
+        marker_color='lightskyblue'
+    ))
+
+    # Add bars for total customers
+    fig15.add_trace(go.Bar(
+        x=channel_data['channel'],
+        y=channel_data['total_customers'],
+        error_y=approximate.error_bars(channel_data, 'total_customers'),
+        name='Total Customers',
+        marker_color='lightgreen'
+    ))
+
+    # Update layout for better visualization
+    fig15.update_layout(
+        title=f"Channel Effectiveness Analysis - {region_choice}{approximate.note(channel_data)}",
+        xaxis_title="Channel",
+        yaxis_title="Count",
+        barmode='group',  # Group bars side-by-side
+        font=dict(size=14),
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot area
+        legend=dict(title="Metrics", orientation="h", yanchor="bottom", y=1.02, xanchor="center", x=0.5),
+        xaxis_tickangle=-45  # Rotate x-axis labels
+    )
+    return fig15
+
+
+#plot16
+month_names = [
+    'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December'
+]
+
+
+def plot16_queries(region_choice, controls):
+    query = """
+    SELECT
+        region_name,
+        month,
+        SUM(total_amt_usd) AS total_sales
+    FROM order_cube
+    GROUP BY region_name, month;
+    """
+    return {'seasonal': query}
+
+
+def plot16_data(results, region_choice, controls):
+    seasonal_data = select_region(results['seasonal'], region_choice, by=['month'])
+    seasonal_data = seasonal_data.sort_values('month').reset_index(drop=True)
+    seasonal_data['month_name'] = seasonal_data['month'].apply(lambda x: month_names[int(x) - 1])
+    return seasonal_data
+
+
+def plot16_figure(seasonal_data, region_choice):
+    # Create a polar bar chart for seasonal trends
+    fig16 = go.Figure()
+
+    fig16.add_trace(go.Barpolar(
+        r=seasonal_data['total_sales'],
+        theta=seasonal_data['month_name'],
+        width=[30] * len(seasonal_data),  # Bar width
+        marker=dict(
+            color=seasonal_data['total_sales'],
+            colorscale='viridis',  # Gradient color scheme with good contrast
+            showscale=True,
+            colorbar=dict(
+                title='Total Sales (USD)',
+                titlefont=dict(size=14, color='white'),
+                tickfont=dict(size=12, color='white')
+            )
+        ),
+        name='Seasonal Sales'
+    ))
+
+    # Update layout for better readability
+    fig16.update_layout(
+        title=dict(
+            text=f"Seasonal Sales Trends ({region_choice})",
+            font=dict(size=18, color='white')
+        ),
+        polar=dict(
+            angularaxis=dict(
+                direction='clockwise',
+                tickmode='array',
+                tickvals=list(range(1, 13)),
+                ticktext=month_names,
+                tickfont=dict(size=12, color='white')  # White for contrast
+            ),
+            radialaxis=dict(
+                visible=True,
+                title="Total Sales (USD)",
+                titlefont=dict(size=14, color='white'),
+                tickfont=dict(size=12, color='white')
+            )
+        ),
+        font=dict(size=14, color='white'),
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)'  # Transparent plot area
+    )
+    return fig16
+
+
+#plot17
+def plot17_queries(region_choice, controls):
+    # Ranks are relative to the accounts shown: across all regions, or within the chosen one
+    if region_choice == "All Regions":
+        order_rank, spend_rank = 'order_rank', 'spend_rank'
+    else:
+        order_rank, spend_rank = 'region_order_rank', 'region_spend_rank'
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT
+        account_name,
+        order_count AS total_orders,
+        total_amt_usd AS total_spend,
+        {order_rank} AS order_rank,
+        {spend_rank} AS spend_rank
+    FROM account_stats
+    WHERE {where}
+    ORDER BY order_rank, spend_rank;
+    """
+    return {'accounts': (query, params)}
+
+
+def plot17_data(results, region_choice, controls):
+    accounts = results['accounts']
+    top_rank, moderate_rank = controls['segment_ranks']
+
+    def rank_segment(ranks, labels):
+        ranks = ranks.to_numpy()
+        codes = bucket([ranks <= top_rank, ranks <= moderate_rank])
+        return pd.Categorical.from_codes(codes, labels, validate=False)
+
+    return accounts[['account_name', 'total_orders', 'total_spend']].assign(
+        order_activity_segment=rank_segment(
+            accounts['order_rank'], ['Highly Active', 'Moderately Active', 'Less Active']),
+        spending_segment=rank_segment(
+            accounts['spend_rank'], ['High Spender', 'Moderate Spender', 'Low Spender']),
+    )
+
+
+activity_colors = {
+    'Highly Active': 'rgba(54, 162, 235, 0.6)',
+    'Moderately Active': 'rgba(255, 159, 64, 0.6)',
+    'Less Active': 'rgba(255, 99, 132, 0.6)',
+}
+
+
+def plot17_figure(customer_segmentation_data, region_choice):
+    # Markers are coloured by segment code through a stepped colour scale: a per-point array of
+    # colour strings would be validated one string at a time
+    segments = customer_segmentation_data['order_activity_segment'].cat
+    last = len(segments.categories) - 1
+    colorscale = [[code / last, activity_colors[segment]] for code, segment in enumerate(segments.categories)]
+
+    # Create a scatter plot for customer segmentation
+    fig17 = go.Figure()
+
+    # Add a scatter plot for customer segments
+    fig17.add_trace(go.Scatter(
+        x=customer_segmentation_data['total_orders'],
+        y=customer_segmentation_data['total_spend'],
+        mode='markers',
+        text=customer_segmentation_data['account_name'],
+        hoverinfo='text+x+y',  # Show account name, orders, and spend on hover
+        marker=dict(
+            size=12,
+            color=segments.codes,
+            colorscale=colorscale,
+            cmin=0,
+            cmax=last,
+            line=dict(color='black', width=1)  # Black outline for better visibility
+        ),
+        name="Customer Segmentation"
+    ))
+
+    # Update layout for the scatter plot
+    fig17.update_layout(
+        title=f"Customer Segmentation by Purchase Frequency and Total Spend ({region_choice})",
+        xaxis=dict(
+            title="Total Orders",
+            titlefont=dict(size=14, color='white'),
+            tickfont=dict(size=12, color='white')
+        ),
+        yaxis=dict(
+            title="Total Spend (USD)",
+            titlefont=dict(size=14, color='white'),
+            tickfont=dict(size=12, color='white')
+        ),
+        font=dict(size=14, color='white'),
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot area
+        showlegend=False  # Hide legend for clarity
+    )
+    return fig17
+
+
+# Plot18
+def plot18_queries(region_choice, controls):
+    # region_code numbers the regions in name order, so plot18_data never factorizes strings
+    where, params = region_filter(region_choice)
+    query = f"""
+    SELECT
+        region_name,
+        DENSE_RANK() OVER (ORDER BY region_name) - 1 AS region_code,
+        order_count,
+        CAST(total_amt_usd AS DOUBLE) AS total_sales
+    FROM account_stats
+    WHERE {where}
+    ORDER BY region_code;
+    """
+    return {'accounts': (query, params)}
+
+
+activity_segments = ['High Activity', 'Medium Activity', 'Low Activity']
+
+
+def plot18_data(results, region_choice, controls):
+    accounts = results['accounts']
+    if accounts.empty:
+        return pd.DataFrame(columns=['region_name', 'activity_segment', 'avg_sales'])
+    medium_orders, high_orders = controls['activity_orders']
+    order_count = accounts['order_count'].to_numpy()
+
+    # Segment code = region * 3 + activity
+    regions = accounts['region_code'].to_numpy()
+    region_names = accounts['region_name'].to_numpy()[np.searchsorted(regions, np.arange(regions[-1] + 1))]
+    activity = bucket([order_count > high_orders, order_count >= medium_orders])
+    codes = regions * len(activity_segments) + activity
+    segments = len(region_names) * len(activity_segments)
+
+    num_accounts = np.bincount(codes, minlength=segments)
+    present = np.flatnonzero(num_accounts)
+    return pd.DataFrame({
+        'region_name': region_names[present // len(activity_segments)],
+        'activity_segment': [activity_segments[code % len(activity_segments)] for code in present],
+        'avg_sales': segment_average(codes, num_accounts, accounts['total_sales'].to_numpy())[present],
+    }).sort_values(['region_name', 'avg_sales'], ascending=[True, False]).reset_index(drop=True)
+
+
+def plot18_figure(activity_sales_data, region_choice):
+    # Create a plot with colors corresponding to different regions
+    fig18 = go.Figure()
+
+    # Define colors for each region
+    region_colors = {
+        'North': 'rgba(54, 162, 235, 0.6)',   # Blue
+        'South': 'rgba(255, 159, 64, 0.6)',   # Orange
+        'East': 'rgba(75, 192, 192, 0.6)',    # Green
+        'West': 'rgba(153, 102, 255, 0.6)',   # Purple
+        'Central': 'rgba(255, 99, 132, 0.6)', # Red
+    }
+
+    # Add traces for each region in the selected data
+    for region, region_data in split_groups(activity_sales_data, 'region_name'):
+        fig18.add_trace(go.Bar(
+            x=region_data['activity_segment'],
+            y=region_data['avg_sales'],
+            name=region,
+            marker=dict(color=region_colors.get(region, 'rgba(169, 169, 169, 0.6)')),  # Default color if region is not listed
+            text=region_data['activity_segment'],
+            hoverinfo='text+y',  # Show activity segment and avg sales
+        ))
+
+    # Update layout for the bar chart
+    fig18.update_layout(
+        title=f"Average Sales by Account Activity Segment ({region_choice})",
+        xaxis=dict(title="Account Activity Segment"),
+        yaxis=dict(title="Average Sales (USD)"),
+        barmode='stack',  # Stack bars for each region
+        paper_bgcolor='rgba(0,0,0,0)',  # Transparent background
+        plot_bgcolor='rgba(0,0,0,0)',  # Transparent plot area
+        font=dict(size=14, color='white'),
+    )
+    return fig18
+
+PANELS = {
+    'plot1': Panel(plot1_queries, plot1_data, plot1_figure),
+    'plot2': Panel(plot2_queries, plot2_data, plot2_figure),
+    'plot3': Panel(plot3_queries, plot3_data, plot3_figure),
+    'plot4': Panel(plot4_queries, plot4_data, plot4_figure),
+    'plot5': Panel(plot5_queries, plot5_data, plot5_figure),
+    'plot6': Panel(plot6_queries, plot6_data, plot6_figure, ('volume_orders', 'high_value_usd')),
+    'plot7': Panel(plot7_queries, plot7_data, plot7_figure),
+    'plot8': Panel(plot8_queries, plot8_data, plot8_figure),
+    'plot9': Panel(plot9_queries, plot9_data, plot9_figure),
+    'plot10': Panel(plot10_queries, plot10_data, plot10_figure),
+    'plot11': Panel(plot11_queries, plot11_data, plot11_figure, ('approximate',)),
+    'plot12': Panel(plot12_queries, plot12_data, plot12_figure),
+    'plot13': Panel(plot13_queries, plot13_data, plot13_figure, ('compare_years',)),
+    'plot14': Panel(plot14_queries, plot14_data, plot14_figure),
+    'plot15': Panel(plot15_queries, plot15_data, plot15_figure, ('approximate',)),
+    'plot16': Panel(plot16_queries, plot16_data, plot16_figure),
+    'plot17': Panel(plot17_queries, plot17_data, plot17_figure, ('segment_ranks',)),
+    'plot18': Panel(plot18_queries, plot18_data, plot18_figure, ('activity_orders',)),
+}
+
+# Dashboard sections, each computed only when it is opened
+SECTIONS = {
+    'Regional': ['plot1', 'plot5', 'plot2', 'plot4', 'plot12', 'plot7'],
+    'Customers': ['plot6', 'plot9', 'plot10', 'plot14', 'plot17', 'plot18'],
+    'Channels': ['plot3', 'plot11', 'plot15'],
+    'Trends': ['plot8', 'plot13', 'plot16'],
+}
+
+
+def panel_key(name, region_choice, controls, data_version):
+    # Everything a panel's figure depends on: other panels' controls don't invalidate it
+    controls = {**DEFAULT_CONTROLS, **(controls or {})}
+    return name, region_choice, tuple(controls[control] for control in PANELS[name].controls), data_version
+
+
+def compute_panels(runner, names, region_choice, controls=None, timings=None):
+    # Submit the queries of every requested panel at once, then build the figures.
+    # `controls` overrides DEFAULT_CONTROLS; `timings`, if given, receives each panel's
+    # phase timings and row counts
+    controls = {**DEFAULT_CONTROLS, **(controls or {})}
+    panel_queries = {name: PANELS[name].queries(region_choice, controls) for name in names}
+    query_stats = {}
+    results = runner.run_many(
+        {(name, key): query for name, queries in panel_queries.items() for key, query in queries.items()},
+        query_stats
+    )
+
+    figures = {}
+    for name in names:
+        panel = PANELS[name]
+        started = time.perf_counter()
+        data = panel.data({key: results[name, key] for key in panel_queries[name]}, region_choice, controls)
+        building = time.perf_counter()
+        figures[name] = panel.figure(data, region_choice)
+        finished = time.perf_counter()
+
+        if timings is not None:
+            stats = [query_stats[name, key] for key in panel_queries[name]]
+            timings[name] = {
+                'queries': len(stats),
+                'cached_queries': sum(s['cached'] for s in stats),
+                'query_seconds': sum(s['query_seconds'] for s in stats),
+                'df_seconds': sum(s['df_seconds'] for s in stats),
+                'result_rows': sum(s['rows'] for s in stats),
+                'data_seconds': building - started,
+                'rows': len(data),
+                'figure_seconds': finished - building,
+            }
+    return figures
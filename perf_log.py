@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import pandas as pd
+
+import sales_data
+
+logger = logging.getLogger(__name__)
+
+PERF_LOG_PATH = os.environ.get('SALES_PERF_LOG', os.path.join(sales_data.DATA_DIR, 'panel_timings.jsonl'))
+
+# Phases of a panel, in the order they run during a rerun
+PHASES = ['query_seconds', 'df_seconds', 'data_seconds', 'figure_seconds', 'chart_seconds']
+
+_lock = threading.Lock()
+
+
+def enabled(query_params):
+    # Opt in per page with ?perf=1, or for every session with SALES_PERF=1
+    return query_params.get('perf') == '1' or os.environ.get('SALES_PERF') == '1'
+
+
+def make_records(timings, **context):
+    # One record per panel for a rerun; `context` (region, data version, ...) is repeated on each
+    run_id = uuid.uuid4().hex
+    logged_at = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    records = []
+    for panel, stats in timings.items():
+        record = {'logged_at': logged_at, 'run_id': run_id, 'panel': panel, **context, **stats}
+        record['total_seconds'] = sum(stats.get(phase, 0.0) for phase in PHASES)
+        records.append(record)
+    return records
+
+
+def append(records, path=PERF_LOG_PATH):
+    # Sessions share the log file, so each rerun's lines go out in one write under a lock
+    lines = ''.join(json.dumps(record) + '\n' for record in records)
+    try:
+        with _lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+    except OSError:
+        logger.warning("Could not append to performance log %s", path)
+
+
+def summary(records):
+    # Per-panel milliseconds for display, slowest panel first; panels whose figure was
+    # reused only have chart timings
+    frame = pd.DataFrame(records).set_index('panel')
+    columns = PHASES + ['total_seconds']
+    frame = frame.reindex(columns=columns + ['rows', 'payload_bytes'])
+    milliseconds = (frame[columns] * 1000).round(1)
+    milliseconds.columns = [column.replace('_seconds', '_ms') for column in columns]
+    return milliseconds.assign(
+        rows=frame['rows'],
+        payload_kb=(frame['payload_bytes'] / 1024).round(1)
+    ).sort_values('total_ms', ascending=False)
@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pyarrow as pa
+
+import sales_data
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locks, concurrent misses may both compute
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+# Versions whose results are kept on disk: processes still serving the previous data version
+# (e.g. other replicas not yet reopened after an append) keep their results
+KEEP_VERSIONS = 2
+
+
+def _mtime(path):
+    # 0 for a path another process removed meanwhile
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0
+
+
+def normalize_sql(query):
+    # Formatting-only differences (indentation, trailing semicolon) share one entry
+    return _WHITESPACE.sub(' ', query).strip().rstrip(';').strip()
+
+
+class DiskResultCache:
+    """Query results stored as Arrow IPC files, shared by every process that uses `root`.
+
+    Each data and schema version has its own directory, with one file per query fingerprint
+    (a hash of the SQL and parameters). Files are written under a temporary name and renamed
+    into place, so readers only ever see complete results. A per-fingerprint lock file makes processes
+    that miss on the same query at once wait for the first one to store it, instead of all
+    running it.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(key):
+        query, params, _ = key
+        return hashlib.sha256(repr((query, params)).encode()).hexdigest()
+
+    @staticmethod
+    def version_name(data_version):
+        # The schema version is part of the name, as in sales_partitions: a schema change
+        # rebuilds the tables from the same CSVs, so the data version alone stays the same
+        return f'{data_version}-{sales_data.SCHEMA_VERSION}'
+
+    def path(self, key, suffix='.arrow'):
+        return os.path.join(self.root, self.version_name(key[2]), self.fingerprint(key) + suffix)
+
+    def get(self, key):
+        try:
+            with pa.memory_map(self.path(key)) as source:
+                frame = pa.ipc.open_file(source).read_pandas()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, pa.ArrowException) as error:
+            logger.warning("Could not read cached result %s: %s", self.path(key), error)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except (OSError, pa.ArrowException) as error:
+            logger.warning("Could not store cached result %s: %s", path, error)
+
+    @contextmanager
+    def lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        lock_path = self.path(key, '.lock')
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_or_compute(self, key, compute):
+        frame = self.get(key)
+        if frame is None:
+            with self.lock(key):
+                # Another process may have stored it while this one waited for the lock
+                frame = self.get(key)
+                if frame is None:
+                    frame = compute()
+                    self.put(key, frame)
+        return frame
+
+    def prune(self, data_version):
+        # Remove the results of all but the KEEP_VERSIONS most recently written versions,
+        # never those of data_version
+        if not os.path.isdir(self.root):
+            return
+        versions = [
+            os.path.join(self.root, name) for name in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, name))
+        ]
+        versions.sort(key=_mtime, reverse=True)
+        current = os.path.join(self.root, self.version_name(data_version))
+        for path in versions[KEEP_VERSIONS:]:
+            if path != current:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class QueryCache:
+    """Bounded LRU cache of query results keyed by (SQL, parameters, data version).
+
+    Every caller gets the same frame object, so results must be treated as read-only. With
+    a `disk` cache, results missing from memory are looked up there before being computed,
+    and computed ones are stored there too.
+    """
+
+    def __init__(self, max_entries=256, disk=None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pruned_version = None
+
+    @staticmethod
+    def make_key(query, params, data_version):
+        return normalize_sql(query), tuple(params or ()), data_version
+
+    def get(self, key):
+        with self._lock:
+            frame = self._entries.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        with self._lock:
+            self._entries[key] = frame
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, query, params, data_version, compute):
+        key = self.make_key(query, params, data_version)
+        frame = self.get(key)
+        if frame is None:
+            frame = compute() if self.disk is None else self.disk.get_or_compute(key, compute)
+            self.put(key, frame)
+        return frame
+
+    def invalidate(self, data_version=None):
+        # Drop everything, or only the entries that belong to other data versions
+        with self._lock:
+            if data_version is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[2] != data_version]:
+                    del self._entries[key]
+        # Other data versions' files go once per version, not on every call
+        if self.disk is not None and data_version is not None and data_version != self._pruned_version:
+            self.disk.prune(data_version)
+            self._pruned_version = data_version
+
+    def memory_bytes(self):
+        with self._lock:
+            frames = list(self._entries.values())
+        return int(sum(frame.memory_usage(deep=True).sum() for frame in frames))
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,120 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import duckdb
+import plotly.io as pio
+
+import panels
+import sales_data
+from query_cache import QueryCache
+
+FORMATS = ['html', 'png', 'json']
+DEFAULT_OUT_DIR = os.path.join(sales_data.DATA_DIR, 'reports')
+
+
+def region_slug(region):
+    return region.lower().replace(' ', '-')
+
+
+def _write_figure(figure, path, fmt):
+    if fmt == 'html':
+        # plotly.js is copied once into each region directory instead of into every page
+        figure.write_html(path, include_plotlyjs='directory')
+    elif fmt == 'png':
+        figure.write_image(path)
+    else:
+        pio.write_json(figure, path)
+
+
+def render_region(db_path, region, formats, out_dir):
+    # Runs in a worker process, with its own read-only connection, query pool and result cache
+    started = time.perf_counter()
+    con = duckdb.connect(db_path, read_only=True)
+    runner = panels.QueryRunner(con, sales_data.read_data_version(con), QueryCache())
+    try:
+        timings = {}
+        figures = panels.compute_panels(runner, list(panels.PANELS), region, timings=timings)
+    finally:
+        runner.close()
+
+    region_dir = os.path.join(out_dir, region_slug(region))
+    os.makedirs(region_dir, exist_ok=True)
+    for name, figure in figures.items():
+        files = []
+        start = time.perf_counter()
+        for fmt in formats:
+            path = os.path.join(region_dir, f'{name}.{fmt}')
+            _write_figure(figure, path, fmt)
+            files.append(os.path.relpath(path, out_dir))
+        timings[name].update(files=files, render_seconds=time.perf_counter() - start)
+
+    return {
+        'region': region,
+        'data_version': runner.data_version,
+        'pid': os.getpid(),
+        'seconds': time.perf_counter() - started,
+        'panels': timings,
+    }
+
+
+def render_report(regions, formats, out_dir, db_path=sales_data.DB_PATH, workers=None):
+    # Render every panel for each region, the regions in parallel worker processes. Returns
+    # the manifest, also written to out_dir/manifest.json
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(regions)))
+    # Spawned, not forked: a forked child would inherit DuckDB's state from this process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(render_region, db_path, region, formats, out_dir) for region in regions]
+        results = [future.result() for future in futures]
+
+    manifest = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'data_version': results[0]['data_version'] if results else None,
+        'formats': formats,
+        'workers': workers,
+        'wall_seconds': time.perf_counter() - started,
+        'regions': results,
+    }
+    with open(os.path.join(out_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every dashboard panel for every region without Streamlit.")
+    parser.add_argument('--format', nargs='+', choices=FORMATS, default=['html'], help="Output formats")
+    parser.add_argument('--region', action='append', help="Region to render (repeatable, default: all of them)")
+    parser.add_argument('--out-dir', default=DEFAULT_OUT_DIR, help="Directory to write the report to")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per region, up to the CPU count)")
+    parser.add_argument('--db', default=sales_data.DB_PATH, help="Path of the DuckDB database file")
+    parser.add_argument('--data-dir', default=sales_data.DATA_DIR, help="Directory holding the CSV files")
+    args = parser.parse_args()
+
+    if 'png' in args.format:
+        try:
+            import kaleido  # noqa: F401
+        except ImportError:
+            parser.error("PNG output needs the kaleido package (pip install kaleido)")
+
+    # Build or refresh the database once, before the workers open it read-only
+    sales_data.ensure_database(args.db, args.data_dir)
+    regions = args.region
+    if not regions:
+        with duckdb.connect(args.db, read_only=True) as con:
+            regions = ['All Regions'] + [name for name, in con.execute("SELECT name FROM region ORDER BY id;").fetchall()]
+
+    manifest = render_report(regions, args.format, args.out_dir, args.db, args.workers)
+    for result in manifest['regions']:
+        print(f"  {result['region']:<12} {len(result['panels'])} panels  {result['seconds']:.2f}s")
+    print(f"Rendered {len(regions)} regions in {manifest['wall_seconds']:.2f}s "
+          f"with {manifest['workers']} workers to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
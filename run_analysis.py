@@ -0,0 +1,209 @@
+import argparse
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import pyarrow.parquet as pq
+import xlsxwriter
+
+import sales_data
+
+ANALYSIS_SQL = os.path.join(sales_data.DATA_DIR, 'Analysis.sql')
+DEFAULT_OUT_DIR = os.path.join(sales_data.DATA_DIR, 'analysis')
+# Written next to the exports; the hand-made Analyzed.xlsx is only replaced when asked for with --workbook
+WORKBOOK_NAME = 'Analyzed.xlsx'
+
+# Rows fetched from DuckDB, and read back from Parquet, per batch
+BATCH_ROWS = 100_000
+
+# Rows per worksheet, header included; longer results continue on further sheets
+EXCEL_MAX_ROWS = 1_048_576
+
+# "-- 12. Top Performing Regions by Total Sales Amount" starts query 12
+_QUERY_HEADER = re.compile(r'^--\s*(\d+)\.\s*(.*?)\s*$', re.MULTILINE)
+_USE_STATEMENT = re.compile(r'^\s*use\s+\w+\s*;\s*$', re.MULTILINE | re.IGNORECASE)
+# MySQL's DATEDIFF(end, start) in days; DuckDB names the unit and takes start first
+_MYSQL_DATEDIFF = re.compile(r'\bDATEDIFF\(\s*([^,()]+?)\s*,\s*([^,()]+?)\s*\)', re.IGNORECASE)
+
+
+def to_duckdb(query):
+    # The file was written for MySQL; only its DATEDIFF differs in meaning for DuckDB
+    return _MYSQL_DATEDIFF.sub(r"DATEDIFF('day', \2, \1)", query)
+
+
+def split_queries(text):
+    # [(number, title, sql)] for every numbered query, without MySQL's `use sales;`
+    text = _USE_STATEMENT.sub('', text)
+    headers = list(_QUERY_HEADER.finditer(text))
+    queries = []
+    for header, following in zip(headers, headers[1:] + [None]):
+        end = following.start() if following else len(text)
+        sql = text[header.end():end].strip()
+        if sql:
+            queries.append((int(header.group(1)), header.group(2).rstrip('.'), to_duckdb(sql)))
+    return queries
+
+
+def _create_source_views(cursor):
+    # Analysis.sql was written against the CSV tables; the stored ones carry extra columns
+    # (orders' date parts) that would capture names like `month` in a GROUP BY. Temporary
+    # views with the CSV columns shadow them, for this cursor only
+    catalog = cursor.execute("SELECT current_database();").fetchone()[0]
+    for table, columns in sales_data.SCHEMA.items():
+        names = ', '.join(name for name, _ in columns)
+        cursor.execute(f'CREATE TEMP VIEW {table} AS SELECT {names} FROM "{catalog}".main.{table};')
+
+
+class AnalysisRunner:
+    """Runs queries concurrently on a read-only connection, streaming each result to Parquet."""
+
+    def __init__(self, con, out_dir, max_workers=None):
+        self.con = con
+        self.out_dir = out_dir
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self._local = threading.local()
+
+    def _cursor(self):
+        # One cursor per worker thread, as in panels.QueryRunner
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self.con.cursor()
+            _create_source_views(cursor)
+        return cursor
+
+    def parquet_path(self, number):
+        return os.path.join(self.out_dir, f'query_{number:02d}.parquet')
+
+    def run_query(self, number, title, query):
+        path = self.parquet_path(number)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        started = time.perf_counter()
+        reader = self._cursor().execute(query).fetch_record_batch(BATCH_ROWS)
+        executed = time.perf_counter()
+        rows = 0
+        try:
+            with pq.ParquetWriter(tmp_path, reader.schema) as writer:
+                for batch in reader:
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finished = time.perf_counter()
+        return {
+            'query': number,
+            'title': title,
+            'rows': rows,
+            'columns': reader.schema.names,
+            'query_seconds': executed - started,
+            'export_seconds': finished - executed,
+            'seconds': finished - started,
+            'parquet': os.path.relpath(path, self.out_dir),
+        }
+
+    def run(self, queries):
+        os.makedirs(self.out_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='analysis-query') as executor:
+            futures = [executor.submit(self.run_query, *query) for query in queries]
+            return [future.result() for future in futures]
+
+
+def _parquet_rows(path):
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=BATCH_ROWS):
+        yield from zip(*(column.to_pylist() for column in batch.columns))
+
+
+def write_workbook(results, out_dir, workbook_path):
+    # One sheet per query, named by its number like the hand-made workbook. Rows are streamed
+    # from the Parquet exports and flushed as they are written (constant_memory), so no
+    # result has to fit in memory
+    tmp_path = f'{workbook_path}.{os.getpid()}.tmp'
+    workbook = xlsxwriter.Workbook(tmp_path, {
+        'constant_memory': True,
+        'nan_inf_to_errors': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'remove_timezone': True,
+    })
+    header = workbook.add_format({'bold': True})
+    try:
+        for result in results:
+            rows = _parquet_rows(os.path.join(out_dir, result['parquet']))
+            part, row = 0, EXCEL_MAX_ROWS
+            # The leading None opens the first sheet, so empty results still get their header
+            for values in itertools.chain([None], rows):
+                if row == EXCEL_MAX_ROWS:
+                    part += 1
+                    name = str(result['query']) if part == 1 else f"{result['query']} ({part})"
+                    sheet = workbook.add_worksheet(name)
+                    sheet.write_row(0, 0, result['columns'], header)
+                    row = 1
+                if values is not None:
+                    sheet.write_row(row, 0, values)
+                    row += 1
+        workbook.close()
+        os.replace(tmp_path, workbook_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the numbered queries in Analysis.sql and export their results.")
+    parser.add_argument('--sql', default=ANALYSIS_SQL, help="SQL file with `-- N. title` numbered queries")
+    parser.add_argument('--only', type=int, nargs='+', help="Query numbers to run (default: all)")
+    parser.add_argument('--out-dir', default=DEFAULT_OUT_DIR, help="Directory for the Parquet exports and timings")
+    parser.add_argument('--workbook', help=f"xlsx file to write, one sheet per query (default: {WORKBOOK_NAME} in --out-dir)")
+    parser.add_argument('--no-workbook', action='store_true', help="Only write the Parquet exports")
+    parser.add_argument('--workers', type=int, help="Queries run at once (default: CPU count, up to 8)")
+    parser.add_argument('--db', default=sales_data.DB_PATH, help="Path of the DuckDB database file")
+    args = parser.parse_args()
+    workbook_path = args.workbook or os.path.join(args.out_dir, WORKBOOK_NAME)
+
+    with open(args.sql, encoding='utf-8') as f:
+        queries = split_queries(f.read())
+    if args.only:
+        queries = [query for query in queries if query[0] in args.only]
+
+    sales_data.ensure_database(args.db)
+    started = time.perf_counter()
+    with duckdb.connect(args.db, read_only=True) as con:
+        runner = AnalysisRunner(con, args.out_dir, args.workers)
+        results = runner.run(queries)
+        data_version = sales_data.read_data_version(con)
+    queries_seconds = time.perf_counter() - started
+
+    workbook_seconds = None
+    if not args.no_workbook:
+        start = time.perf_counter()
+        write_workbook(results, args.out_dir, workbook_path)
+        workbook_seconds = time.perf_counter() - start
+
+    timings_path = os.path.join(args.out_dir, 'timings.json')
+    with open(timings_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'data_version': data_version,
+            'workers': runner.max_workers,
+            'queries_seconds': queries_seconds,
+            'workbook_seconds': workbook_seconds,
+            'queries': results,
+        }, f, indent=2)
+
+    for result in results:
+        print(f"  {result['query']:>2}. {result['title'][:60]:<60} {result['rows']:>8} rows  "
+              f"{result['query_seconds'] * 1000:8.1f} ms  {result['export_seconds'] * 1000:8.1f} ms export")
+    print(f"Ran {len(results)} queries in {queries_seconds:.2f}s with {runner.max_workers} workers; "
+          f"timings in {timings_path}")
+    if workbook_seconds is not None:
+        print(f"Wrote {workbook_path} in {workbook_seconds:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import sales_data
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS_DIR = os.environ.get('SALES_PARTITIONS_DIR', os.path.join(sales_data.DATA_DIR, 'partitions'))
+
+# Fact tables and rollups the panels filter by region and year, written as Hive-partitioned
+# Parquet (region_name=West/year=2016/...). A region or year filter then only opens the
+# matching files; account_stats has no year, so it is split by region only
+PARTITIONED_TABLES = {
+    'order_facts': ['region_name', 'year'],
+    'web_event_facts': ['region_name', 'year'],
+    'order_cube': ['region_name', 'year'],
+    'web_event_cube': ['region_name', 'year'],
+    'web_event_hll': ['region_name', 'year'],
+    'web_event_sample': ['region_name'],
+    'account_stats': ['region_name'],
+}
+HIVE_TYPES = {'region_name': 'VARCHAR', 'year': 'INTEGER'}
+
+# Bounded by the number of accounts or the sample size, and changed in every region by any
+# batch (global ranks, the bottom-k sample): rewritten whole instead of by partition
+REWRITTEN_TABLES = {'web_event_sample', 'account_stats'}
+
+# Exports kept per directory; older data versions are removed once a new one is written
+KEEP_VERSIONS = 2
+
+
+def version_dir(out_dir, data_version):
+    # Each data version is written once into its own directory and never modified; the
+    # schema version is part of the name, since the tables exported change with it
+    return os.path.join(out_dir, f'{data_version}-{sales_data.SCHEMA_VERSION}')
+
+
+def manifest_path(out_dir, data_version):
+    return os.path.join(version_dir(out_dir, data_version), 'manifest.json')
+
+
+def _data_version(db_path):
+    con = sales_data.open_snapshot(db_path)
+    try:
+        return sales_data.read_data_version(con)
+    finally:
+        con.close()
+
+
+def _table_glob(table_dir, table):
+    depth = len(PARTITIONED_TABLES[table])
+    return os.path.join(table_dir, table, *['*'] * depth, '*.parquet')
+
+
+def _remove_old_versions(out_dir, data_version):
+    versions = [
+        os.path.join(out_dir, name) for name in os.listdir(out_dir)
+        if not name.startswith('.') and os.path.isdir(os.path.join(out_dir, name))
+    ]
+    versions.sort(key=os.path.getmtime, reverse=True)
+    for path in versions[KEEP_VERSIONS:]:
+        if path != version_dir(out_dir, data_version):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _previous_export(out_dir, data_version, last_batch, data_dir):
+    # The newest export that `data_version` extends by whole appended batches, and those
+    # batches' directories; (None, None) when there is none, e.g. after a full rebuild
+    if last_batch is None:
+        return None, None
+    versions = [
+        os.path.join(out_dir, name) for name in os.listdir(out_dir)
+        if not name.startswith('.') and name.endswith(f'-{sales_data.SCHEMA_VERSION}')
+    ]
+    for path in sorted(versions, key=os.path.getmtime, reverse=True):
+        try:
+            with open(os.path.join(path, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if manifest.get('last_batch') is None:
+            continue
+        batches = sales_data.batches_between(manifest['data_version'], manifest['last_batch'], data_version, data_dir)
+        if batches:
+            return path, batches
+    return None, None
+
+
+def _link_or_copy(src, dst):
+    # Unchanged partition files are shared with the previous export rather than written again
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _rewrite_partitions(con, table, table_dir):
+    # Write the partitions of `table` holding rows of the `touched` (region, year) pairs into
+    # table_dir, replacing those linked from the previous export
+    partition_by = PARTITIONED_TABLES[table]
+    staging = tempfile.mkdtemp(prefix=f'.{table}-', dir=os.path.dirname(table_dir))
+    try:
+        con.execute(
+            f"COPY (SELECT * FROM {table} SEMI JOIN touched USING ({', '.join(partition_by)})) "
+            f"TO '{staging}' (FORMAT PARQUET, PARTITION_BY ({', '.join(partition_by)}), OVERWRITE_OR_IGNORE);"
+        )
+        for written in glob.glob(os.path.join(staging, *['*'] * len(partition_by))):
+            target = os.path.join(table_dir, os.path.relpath(written, staging))
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(written, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def export_partitions(db_path=sales_data.DB_PATH, out_dir=PARTITIONS_DIR, data_dir=sales_data.DATA_DIR):
+    """Write the partitioned tables of the database's data version into out_dir/<data version>.
+
+    When the data version only adds appended batches to an exported one, that export's files
+    are linked and only the region/year partitions the batches touched are written (plus
+    REWRITTEN_TABLES), so an append costs what it touched rather than the whole history.
+    Returns the manifest, also written as manifest.json in that directory.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    con = sales_data.open_snapshot(db_path)
+    try:
+        data_version = sales_data.read_data_version(con)
+        last_batch = sales_data.read_last_batch(con)
+        previous, batches = _previous_export(out_dir, data_version, last_batch, data_dir)
+        if previous is not None:
+            con.execute("CREATE TEMP TABLE touched (region_name VARCHAR, year INTEGER);")
+            for batch_dir in batches:
+                for path in sales_data.batch_files(batch_dir).values():
+                    con.execute("""
+                        INSERT INTO touched
+                        SELECT DISTINCT a.region_name, b.year
+                        FROM read_parquet(?) b JOIN account_dim a ON a.account_id = b.account_id;
+                    """, [path])
+        # Written next to the final directory and renamed into place when complete, so
+        # readers never see a partial export
+        tmp_dir = tempfile.mkdtemp(prefix='.export-', dir=out_dir)
+        try:
+            tables = {}
+            for table, partition_by in PARTITIONED_TABLES.items():
+                started = time.perf_counter()
+                table_dir = os.path.join(tmp_dir, table)
+                incremental = previous is not None and table not in REWRITTEN_TABLES
+                if incremental:
+                    shutil.copytree(os.path.join(previous, table), table_dir, copy_function=_link_or_copy)
+                    _rewrite_partitions(con, table, table_dir)
+                else:
+                    con.execute(f"COPY {table} TO '{table_dir}' (FORMAT PARQUET, PARTITION_BY ({', '.join(partition_by)}));")
+                tables[table] = {
+                    'partition_by': partition_by,
+                    'rows': con.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0],
+                    'incremental': incremental,
+                    'seconds': time.perf_counter() - started,
+                }
+            manifest = {
+                'data_version': data_version,
+                'last_batch': last_batch,
+                'previous': os.path.basename(previous) if previous else None,
+                'tables': tables,
+            }
+            with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                os.rename(tmp_dir, version_dir(out_dir, data_version))
+            except OSError:
+                # Another process exported the same version first
+                if not os.path.isdir(version_dir(out_dir, data_version)):
+                    raise
+                shutil.rmtree(tmp_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    finally:
+        con.close()
+    _remove_old_versions(out_dir, data_version)
+    return manifest
+
+
+def ensure_partitions(db_path=sales_data.DB_PATH, out_dir=PARTITIONS_DIR):
+    # Returns True when the database's data version had to be exported
+    if os.path.exists(manifest_path(out_dir, _data_version(db_path))):
+        return False
+    export_partitions(db_path, out_dir)
+    return True
+
+
+_exporting = set()
+_exporting_lock = threading.Lock()
+
+
+def export_in_background(db_path=sales_data.DB_PATH, out_dir=PARTITIONS_DIR):
+    # ensure_partitions() on a daemon thread, unless one is already running for out_dir
+    with _exporting_lock:
+        if out_dir in _exporting:
+            return
+        _exporting.add(out_dir)
+
+    def run():
+        try:
+            ensure_partitions(db_path, out_dir)
+        except Exception:
+            logger.exception("Could not export the partitions of %s to %s", db_path, out_dir)
+        finally:
+            with _exporting_lock:
+                _exporting.discard(out_dir)
+
+    threading.Thread(target=run, name='partition-export', daemon=True).start()
+
+
+def connect(db_path=sales_data.DB_PATH, out_dir=PARTITIONS_DIR):
+    """sales_data.open_snapshot() connection where the partitioned tables read the Parquet
+    export of the database's data version instead.
+
+    Panel SQL runs unchanged: a region or year filter is pushed into the Parquet scan, which
+    skips the files of other partitions (also for parameters of prepared statements).
+    """
+    con = sales_data.open_snapshot(db_path)
+    data_version = sales_data.read_data_version(con)
+    table_dir = version_dir(out_dir, data_version)
+    if not os.path.exists(manifest_path(out_dir, data_version)):
+        con.close()
+        raise FileNotFoundError(f"No partitioned export of data version {data_version} in {out_dir}")
+
+    for table in PARTITIONED_TABLES:
+        hive_types = ', '.join(f"'{column}': {HIVE_TYPES[column]}" for column in PARTITIONED_TABLES[table])
+        source = (f"read_parquet('{_table_glob(table_dir, table)}', "
+                  f"hive_partitioning = true, hive_types = {{{hive_types}}})")
+        # Stored column order and types; Parquet has no ENUM, so channels are cast back
+        stored = con.execute(
+            "SELECT column_name, data_type FROM duckdb_columns() "
+            "WHERE database_name = 'store' AND table_name = ? ORDER BY column_index;", [table]
+        ).fetchall()
+        read = dict(con.execute(f"SELECT column_name, column_type FROM (DESCRIBE SELECT * FROM {source});").fetchall())
+        columns = ', '.join(
+            name if read[name] == data_type else f'CAST({name} AS {data_type}) AS {name}'
+            for name, data_type in stored
+        )
+        con.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT {columns} FROM {source};")
+    return con
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the fact tables as Parquet partitioned by region and year.")
+    parser.add_argument('--db', default=sales_data.DB_PATH, help="Path of the DuckDB database file")
+    parser.add_argument('--out-dir', default=PARTITIONS_DIR, help="Directory to write the partitioned tables to")
+    parser.add_argument('--force', action='store_true', help="Export again even if this data version already is")
+    args = parser.parse_args()
+
+    sales_data.ensure_database(args.db)
+    data_version = _data_version(args.db)
+    if os.path.exists(manifest_path(args.out_dir, data_version)):
+        if not args.force:
+            print(f"{args.out_dir} is up to date")
+            return
+        shutil.rmtree(version_dir(args.out_dir, data_version))
+    manifest = export_partitions(args.db, args.out_dir)
+    for table, info in manifest['tables'].items():
+        how = 'touched partitions' if info['incremental'] else 'all partitions'
+        print(f"  {table:<16} by {', '.join(info['partition_by']):<18} {info['rows']:>9} rows  "
+              f"{how:<18} {info['seconds']:.2f}s")
+    print(f"Exported data version {manifest['data_version']} to {args.out_dir}")
+
+
+if __name__ == '__main__':
+    main()
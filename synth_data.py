@@ -0,0 +1,171 @@
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+import sales_data
+
+# Tables copied unchanged: the region / rep hierarchy stays the same at every scale
+FIXED_TABLES = ['region', 'sales_reps']
+
+# List prices per unit; every amount in orders.csv is quantity * price
+UNIT_PRICES = {'standard': 4.99, 'gloss': 7.49, 'poster': 8.12}
+
+# Rows generated per write, so large scales never hold a whole table in memory
+CHUNK_ROWS = 2_000_000
+
+# Copies other than the first are perturbed by this much
+TIME_JITTER = pd.Timedelta(days=3)
+QTY_JITTER = 0.15
+LATLONG_JITTER = 0.05
+
+
+def _load_templates(data_dir):
+    frames = {}
+    for table in ['accounts', 'orders', 'web_events']:
+        frame = sales_data.load_data(sales_data.csv_path(table, data_dir))
+        frames[table] = frame.astype({
+            name: str for name, dtype in frame.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)
+        })
+    return frames
+
+
+def _id_stride(ids):
+    # Copy k of id x becomes x + k * stride, so generated ids never collide
+    return 10 ** len(str(int(ids.max())))
+
+
+def _jitter_times(times, copies, rng):
+    # Shift copied rows by up to TIME_JITTER, clamped to the template's date range so
+    # yearly and monthly totals keep their shape
+    offsets = rng.uniform(-1, 1, len(times)) * TIME_JITTER.total_seconds() * (copies > 0)
+    shifted = times + pd.to_timedelta(np.rint(offsets), unit='s')
+    return shifted.clip(times.min(), times.max()).astype('datetime64[s]')
+
+
+class _Writer:
+    """Appends generated chunks to one CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+
+    def write(self, frame):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = pacsv.CSVWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _accounts_chunk(accounts, copies, rng, stride):
+    n = len(accounts)
+    copy = np.repeat(copies, n)
+    perturbed = copy > 0
+    template = pd.concat([accounts] * len(copies), ignore_index=True)
+
+    # Copy 0 is the template itself, later copies get new ids, numbered names and nearby locations
+    name = template['name'].where(~perturbed, template['name'] + ' #' + copy.astype(str))
+    return pd.DataFrame({
+        'id': template['id'] + copy * stride,
+        'name': name,
+        'website': template['website'],
+        'lat': (template['lat'] + rng.normal(0, LATLONG_JITTER, len(template)) * perturbed).round(8),
+        'long': (template['long'] + rng.normal(0, LATLONG_JITTER, len(template)) * perturbed).round(8),
+        'primary_poc': template['primary_poc'],
+        'sales_rep_id': template['sales_rep_id'],
+    })
+
+
+def _orders_chunk(orders, copies, rng, stride, account_stride):
+    copy = np.repeat(copies, len(orders))
+    perturbed = copy > 0
+    template = pd.concat([orders] * len(copies), ignore_index=True)
+
+    chunk = pd.DataFrame({
+        'id': template['id'] + copy * stride,
+        'account_id': template['account_id'] + copy * account_stride,
+        'occurred_at': _jitter_times(template['occurred_at'], copy, rng),
+    })
+    # Scale each quantity by a little noise (zero stays zero) and price it at list price
+    noise = np.where(perturbed, rng.lognormal(0, QTY_JITTER, len(template)), 1.0)
+    for paper, price in UNIT_PRICES.items():
+        chunk[f'{paper}_qty'] = np.rint(template[f'{paper}_qty'] * noise).astype('int32')
+    chunk['total'] = chunk[[f'{paper}_qty' for paper in UNIT_PRICES]].sum(axis=1).astype('int32')
+    for paper, price in UNIT_PRICES.items():
+        chunk[f'{paper}_amt_usd'] = (chunk[f'{paper}_qty'] * price).round(2)
+    chunk['total_amt_usd'] = chunk[[f'{paper}_amt_usd' for paper in UNIT_PRICES]].sum(axis=1).round(2)
+    return chunk
+
+
+def _web_events_chunk(web_events, copies, rng, stride, account_stride):
+    copy = np.repeat(copies, len(web_events))
+    template = pd.concat([web_events] * len(copies), ignore_index=True)
+    return pd.DataFrame({
+        'id': template['id'] + copy * stride,
+        'account_id': template['account_id'] + copy * account_stride,
+        'occurred_at': _jitter_times(template['occurred_at'], copy, rng),
+        'channel': template['channel'],
+    })
+
+
+def generate(scale, out_dir, data_dir=sales_data.DATA_DIR, seed=0):
+    """Write the sales CSVs scaled by `scale` into `out_dir`.
+
+    Every account is copied `scale` times with all of its orders and web events, so
+    per-account order counts, channel mix, seasonality and locations keep the shape of
+    the source data. Copy 0 is the source data itself, so scale 1 reproduces it exactly.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    templates = _load_templates(data_dir)
+    for table in FIXED_TABLES:
+        shutil.copyfile(sales_data.csv_path(table, data_dir), sales_data.csv_path(table, out_dir))
+
+    strides = {table: _id_stride(frame['id']) for table, frame in templates.items()}
+    # Largest template decides how many copies go into one chunk
+    copies_per_chunk = max(1, CHUNK_ROWS // max(len(frame) for frame in templates.values()))
+
+    writers = {table: _Writer(sales_data.csv_path(table, out_dir)) for table in templates}
+    try:
+        for start in range(0, scale, copies_per_chunk):
+            copies = np.arange(start, min(start + copies_per_chunk, scale))
+            writers['accounts'].write(
+                _accounts_chunk(templates['accounts'], copies, rng, strides['accounts']))
+            writers['orders'].write(
+                _orders_chunk(templates['orders'], copies, rng, strides['orders'], strides['accounts']))
+            writers['web_events'].write(
+                _web_events_chunk(templates['web_events'], copies, rng, strides['web_events'], strides['accounts']))
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {table: writer.rows for table, writer in writers.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a scaled-up synthetic copy of the sales CSVs.")
+    parser.add_argument('scale', type=int, help="How many copies of every account (1 = the source data)")
+    parser.add_argument('out_dir', help="Directory to write the CSV files to")
+    parser.add_argument('--data-dir', default=sales_data.DATA_DIR, help="Directory holding the source CSV files")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = generate(args.scale, args.out_dir, args.data_dir, args.seed)
+    print(f"Generated {args.scale}x data in {args.out_dir} ({time.perf_counter() - start:.1f}s)")
+    for table, count in rows.items():
+        print(f"  {table:<12} {count:>12,} rows")
+
+
+if __name__ == '__main__':
+    main()